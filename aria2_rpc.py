@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+ARIA2 RPC DAEMON MODULE
+=======================
+
+This module manages ONE long-lived aria2c process and talks to it over its
+JSON-RPC interface. It's responsible for:
+1. Starting the aria2c daemon the first time a download is needed
+2. Sending commands (add a download, ask for its status, ...) to the daemon
+3. Shutting the daemon down when the program finishes
+
+Think of this as the "phone line" to aria2. Instead of hiring a new courier
+(starting a new aria2c process) for every file, we keep one courier on call
+and just phone in new jobs. That way aria2 can reuse its connections and DNS
+cache across all the files we download.
+"""
+
+# ============================================================================
+# IMPORTS
+# ============================================================================
+
+import asyncio
+import json
+import os
+import secrets        # For generating the RPC secret token
+import socket         # For finding a free local port
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+
+# Import our configuration
+from config import (
+    ARIA2_BIN, ARIA2_BASE,
+    ARIA2_RPC_MAX_CONCURRENT, ARIA2_RPC_START_TIMEOUT_SEC,
+)
+
+# ============================================================================
+# DAEMON STATE
+# ============================================================================
+# There is only ever one daemon, so we keep its details in module globals
+
+_proc: Optional[asyncio.subprocess.Process] = None  # The running aria2c process
+_port: Optional[int] = None     # The local port the daemon listens on
+_secret: Optional[str] = None   # The token every RPC call must include
+
+# Lock so two workers starting at the same time don't launch two daemons
+_start_lock = asyncio.Lock()
+
+# An opener that ignores proxy environment variables
+# The daemon lives on 127.0.0.1, so we must never send RPC calls to a proxy
+_OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+# ============================================================================
+# LOW-LEVEL RPC
+# ============================================================================
+
+def _free_port() -> int:
+    """
+    Ask the operating system for a free TCP port on localhost.
+
+    Returns:
+        int: A port number that nothing is listening on right now
+    """
+    # Binding to port 0 makes the OS pick a free port for us
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _post(payload: bytes) -> Dict:
+    """
+    Send one JSON-RPC request to the daemon and return the decoded reply.
+
+    Args:
+        payload (bytes): The JSON-encoded request body
+
+    Returns:
+        Dict: The decoded JSON-RPC reply (contains "result" or "error")
+
+    This is a normal blocking function - callers run it in a thread.
+    """
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{_port}/jsonrpc",
+        data=payload,
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with _OPENER.open(req, timeout=30) as r:
+            return json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        # aria2 reports RPC errors as HTTP 400 with a JSON body explaining why
+        return json.loads(e.read())
+
+async def rpc_call(method: str, *params: Any) -> Any:
+    """
+    Call an aria2 RPC method on the daemon.
+
+    Args:
+        method (str): The aria2 method name, e.g. "aria2.addUri"
+        *params: The method parameters (the secret token is added for us)
+
+    Returns:
+        Any: The "result" part of the reply
+
+    Raises:
+        RuntimeError: If aria2 answered with an error
+        OSError: If the daemon could not be reached at all
+
+    Example:
+        version = await rpc_call("aria2.getVersion")
+    """
+    payload = json.dumps({
+        "jsonrpc": "2.0",
+        "id": "iagrab",
+        "method": method,
+        "params": [f"token:{_secret}", *params],
+    }).encode("utf-8")
+
+    # urllib blocks, so run it in a thread to keep the event loop free
+    reply = await asyncio.to_thread(_post, payload)
+
+    if "error" in reply:
+        raise RuntimeError(f"aria2 rpc {method} failed: {reply['error'].get('message')}")
+
+    return reply.get("result")
+
+# ============================================================================
+# DAEMON LIFECYCLE
+# ============================================================================
+
+async def ensure_daemon() -> None:
+    """
+    Make sure the aria2c RPC daemon is running, starting it if needed.
+
+    Raises:
+        RuntimeError: If the daemon exits or doesn't answer in time
+
+    The first call starts aria2c and waits until it answers RPC calls.
+    Later calls return immediately. If the daemon died for some reason,
+    the next call starts a fresh one.
+    """
+    global _proc, _port, _secret
+
+    async with _start_lock:
+        # Already running? Nothing to do
+        if _proc is not None and _proc.returncode is None:
+            return
+
+        # Pick a port and a random secret so only we can talk to the daemon
+        _port = _free_port()
+        _secret = secrets.token_hex(16)
+
+        args = [ARIA2_BIN]
+        args.extend(ARIA2_BASE)  # Same base behavior as before (continue, no renaming, ...)
+        args.extend([
+            "--enable-rpc",                 # Turn on the JSON-RPC interface
+            "--rpc-listen-all=false",       # Only listen on localhost
+            f"--rpc-listen-port={_port}",   # The port we picked above
+            f"--rpc-secret={_secret}",      # Required token for every call
+            "--daemon=false",               # Stay attached so we can manage the process
+            f"--max-concurrent-downloads={ARIA2_RPC_MAX_CONCURRENT}",
+            f"--stop-with-process={os.getpid()}",  # Exit if we crash without cleaning up
+        ])
+
+        # We don't read the daemon's console output, so throw it away
+        # (an unread pipe would eventually fill up and stall aria2)
+        _proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        # Wait until the daemon answers, or give up after the timeout
+        deadline = time.monotonic() + ARIA2_RPC_START_TIMEOUT_SEC
+        while True:
+            if _proc.returncode is not None:
+                raise RuntimeError(f"aria2c RPC daemon exited with code {_proc.returncode}")
+            try:
+                await rpc_call("aria2.getVersion")
+                return
+            except OSError:
+                # Not listening yet
+                if time.monotonic() > deadline:
+                    raise RuntimeError("aria2c RPC daemon did not start in time")
+                await asyncio.sleep(0.1)
+
+async def shutdown_daemon() -> None:
+    """
+    Stop the aria2c RPC daemon if it's running.
+
+    This should be called once when the program finishes.
+    It's safe to call even if the daemon was never started.
+    """
+    global _proc
+
+    if _proc is None:
+        return
+
+    if _proc.returncode is None:
+        try:
+            # Ask aria2 to stop right away, then wait for it to exit
+            await rpc_call("aria2.forceShutdown")
+            await asyncio.wait_for(_proc.wait(), timeout=5)
+        except Exception:
+            # Daemon didn't answer or didn't exit - stop it the hard way
+            try:
+                _proc.kill()
+            except ProcessLookupError:
+                pass  # It exited on its own in the meantime
+            await _proc.wait()
+
+    _proc = None
@@ -15,6 +15,8 @@ Every other module will import these constants to know:
 This keeps all settings in one place, making it easy to change behavior without hunting through code.
 """
 
+from pathlib import Path  # For the cache directory location
+
 # ============================================================================
 # MEDIA TYPE DEFINITIONS
 # ============================================================================
@@ -70,6 +72,45 @@ AUDIO_EXTS = set(AUDIO_PREFS + [
 IA_BIN = "ia"        # The Internet Archive command-line tool
 ARIA2_BIN = "aria2c" # The aria2 download manager tool
 
+# ============================================================================
+# INTERNET ARCHIVE HTTP API
+# ============================================================================
+# When the optional "aiohttp" package is installed we talk to these HTTP
+# endpoints directly instead of starting the "ia" tool for every request.
+# Without aiohttp, the "ia" tool is used as before.
+
+IA_SCRAPE_URL = "https://archive.org/services/search/v1/scrape"  # Search, paged with a cursor
+IA_METADATA_URL = "https://archive.org/metadata/{identifier}"     # Metadata API (MDAPI)
+
+IA_SCRAPE_PAGE_SIZE = 10000  # Identifiers per scrape request (the API maximum)
+IA_SCRAPE_FILES_PAGE_SIZE = 500  # Items per scrape request when asking for file lists too
+                                 # Full file lists make each item's answer far bigger, and
+                                 # a page must arrive within HTTP_TIMEOUT_SEC below
+IA_PREFETCH_CHUNK = 50       # Items per search request when fetching file lists in bulk
+IA_HTTP_CONNECTIONS = 64     # Maximum open connections to archive.org
+HTTP_DNS_CACHE_SEC = 300     # How long we reuse a DNS lookup (seconds)
+HTTP_KEEPALIVE_SEC = 60      # How long an idle connection is kept open (seconds)
+HTTP_TIMEOUT_SEC = 30        # Give up on a single API request after this long (seconds)
+
+# Host names looked up in the background while you answer the startup
+# questions, so the first request doesn't wait for DNS
+DNS_PREWARM_HOSTS = ("archive.org",)
+
+# ============================================================================
+# METADATA CACHE
+# ============================================================================
+# Item metadata is saved to disk after it's fetched, so re-running the
+# program on the same collection doesn't ask IA for it all over again.
+# Use --no-cache to turn this off, or --cache-ttl to change how long
+# saved metadata is trusted.
+
+META_CACHE_DIR = Path.home() / ".cache" / "ia-collection-grabber" / "meta"
+META_CACHE_TTL_SEC = 24 * 3600  # Saved metadata is reused for up to 24 hours
+
+# The User-Agent we send with every HTTP request
+# It tells the server "we're a personal archiving tool"
+USER_AGENT = "IA-personal-archiver (contact: local)"
+
 # ============================================================================
 # PERFORMANCE SETTINGS (DEFAULTS)
 # ============================================================================
@@ -89,11 +130,59 @@ DEFAULT_ARIA_S = 8           # How many pieces aria2 splits each file into
                              # More pieces = faster download but more complexity
                              # 8 pieces is a good balance
 
-# START_JITTER_SEC: Random delay before starting each download
-# This prevents all downloads from starting at exactly the same time
-# (0.05, 0.25) means wait between 0.05 and 0.25 seconds randomly
-# This is very polite to servers and prevents overwhelming them
-START_JITTER_SEC = (0.05, 0.25)
+# Upper limits for the two settings above
+# Past about 16 connections to the same server, TCP congestion control starts
+# slowing every connection down, so more connections stop making things faster
+ARIA_X_MAX = 16
+ARIA_S_MAX = 16
+
+META_CONCURRENCY = 32       # How many metadata requests can be in flight at once
+                             # Metadata answers are small, so IA tolerates far more
+                             # of these at once than it does downloads
+
+# ADAPTIVE CONCURRENCY (AIMD)
+# The rate gate adjusts how many requests to IA may run at once, the same way
+# TCP adjusts its sending rate: every successful "round" of requests adds one
+# more allowed request (additive increase), and every "slow down" answer
+# from the server halves the number (multiplicative decrease).
+# This only covers IA's API requests (search, metadata, HEAD) - downloads
+# are paced when they start but their number is set by the workers.
+AIMD_START_LIMIT = META_CONCURRENCY  # Where the limit starts
+AIMD_MIN_LIMIT = 1                   # Never go below this many requests in flight
+AIMD_MAX_LIMIT = 64                  # Never go above this many requests in flight
+
+# Metadata prefetching (schedule_fixed)
+# Items are resolved (metadata + file choice) ahead of the download workers,
+# so the next item is usually ready the moment a worker becomes free
+RESOLVERS_PER_WORKER = 2     # Metadata lookups running per download worker
+PREFETCH_PER_WORKER = 4      # Resolved items allowed to wait per download worker
+
+# Choosing the file from an item's file list is quick (a few microseconds
+# per file), but some items list many thousands of files. Lists at least
+# this long are scanned in a worker thread, so the event loop keeps serving
+# other downloads meanwhile; shorter ones aren't worth the thread hand-off.
+PICK_THREAD_MIN_FILES = 2000
+
+# Request pacing (a "token bucket")
+# Every request to IA needs a token; tokens refill at IA_REQUEST_RATE per
+# second, and up to IA_REQUEST_BURST of them can pile up while we're idle.
+# Below that rate requests go out immediately - we only wait when we'd
+# actually be sending faster. A "slow down" answer halves the rate, and
+# every successful request grows it back by IA_REQUEST_RATE_STEP.
+IA_REQUEST_RATE = 8.0        # Requests per second (the most we ever send)
+IA_REQUEST_BURST = 8         # Requests that may start back-to-back after a pause
+IA_REQUEST_RATE_MIN = 0.5    # Never slow down below this many per second
+IA_REQUEST_RATE_STEP = 0.1   # Rate regained per successful request
+
+RETRY_AFTER_MAX_SEC = 3600   # Never back off longer than this, whatever the server says
+
+# Retrying network trouble and "try again later" server errors (500/502/504)
+# Each retry waits a random time between 0 and a limit that doubles every
+# attempt (2s, 4s, 8s, ... up to IA_RETRY_MAX_SEC). The randomness keeps
+# workers that failed together from all retrying at the same moment.
+IA_RETRY_ATTEMPTS = 4        # Tries per request, counting the first one
+IA_RETRY_BASE_SEC = 2.0      # Limit for the first retry's wait
+IA_RETRY_MAX_SEC = 60.0      # The limit never grows past this
 
 # ============================================================================
 # ARIA2 DOWNLOADER SETTINGS
@@ -106,5 +195,62 @@ ARIA2_BASE = [
     "--auto-file-renaming=false", # Don't rename files if there's a conflict
     "--file-allocation=none",     # Don't pre-allocate disk space (faster)
     "--summary-interval=0",       # Don't show progress summary (we handle our own output)
-    "--min-split-size=1M",       # Don't split files smaller than 1 megabyte
+    "--min-split-size=20M",      # Don't split files smaller than 20 megabytes
+                                  # IA media files are usually large; splitting medium
+                                  # files into 1M pieces just opens extra connections.
+                                  # Lower this value if you mostly grab small files.
+    "--piece-length=1M",          # Size of the pieces aria2 tracks inside each split
+    "--disk-cache=64M",           # Buffer writes in memory and flush them in big chunks
+                                  # (fewer write calls, less file fragmentation)
+    "--async-dns=true",           # Look up host names without blocking aria2
 ]
+
+# ARIA2_DNS_SERVERS: Name servers aria2's built-in resolver should ask,
+# e.g. "1.1.1.1,8.8.8.8". None (the default) uses the system's own DNS
+# settings, which is what you want on most networks.
+ARIA2_DNS_SERVERS = None
+if ARIA2_DNS_SERVERS:
+    ARIA2_BASE.append(f"--async-dns-server={ARIA2_DNS_SERVERS}")
+
+# When we run aria2c ourselves, only this many of its last output lines are
+# kept (per stream). That's plenty for error messages and stops a long,
+# chatty run from filling up memory.
+ARIA2_OUTPUT_TAIL_LINES = 200
+
+# The batch strategy downloads files in aria2c runs of this many files each
+# aria2 prints a results table at the end of each run - one line per file
+# plus about ten lines of headings and status legend - which must fit
+# within ARIA2_OUTPUT_TAIL_LINES above (64 + ~10 leaves plenty of room)
+ARIA2_BATCH_SIZE = 64
+
+# ============================================================================
+# ARIA2 RPC DAEMON SETTINGS
+# ============================================================================
+# Instead of starting a brand new aria2c process for every file, we start ONE
+# aria2c in the background ("daemon") and hand it downloads over its JSON-RPC
+# interface. This saves process startup, TLS setup and DNS lookups per file.
+
+ARIA2_RPC_MAX_CONCURRENT = 24   # How many downloads the daemon runs at once
+                                # Must be at least the highest worker count (24)
+                                # or downloads would queue up inside aria2
+
+ARIA2_RPC_POLL_SEC = 1.0        # How often (seconds) we ask aria2 "is it done yet?"
+
+ARIA2_RPC_START_TIMEOUT_SEC = 10.0  # How long we wait for the daemon to start answering
+
+# ============================================================================
+# RESULTS LOG
+# ============================================================================
+
+# The CSV results log (download_log.csv) is written in batches of up to
+# this many rows, instead of one write per row
+LOG_BATCH_ROWS = 64
+
+# ============================================================================
+# DISK SPACE CHECKS
+# ============================================================================
+
+# Every item checks the free disk space before downloading. The answer is
+# reused for this many seconds - free space can't change much faster than
+# downloads finish, and it saves asking the OS once per item
+DISK_CHECK_TTL_SEC = 2.0
@@ -5,9 +5,10 @@ DOWNLOAD MANAGEMENT MODULE
 
 This module handles the actual downloading of files using the aria2 downloader.
 It's responsible for:
-1. Setting up aria2 download commands
+1. Handing downloads to the shared aria2 RPC daemon (see aria2_rpc.py)
 2. Detecting rate limiting in download errors
 3. Managing the download process
+4. Downloading a whole batch of files with one aria2c run
 
 Think of this as the "download engine" that takes a URL and saves the file to disk.
 """
@@ -17,17 +18,57 @@ Think of this as the "download engine" that takes a URL and saves the file to di
 # ============================================================================
 
 import asyncio
+import logging
+import os
+import re
+import tempfile
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional, Union
 
 # Import our configuration and utilities
-from config import ARIA2_BIN, ARIA2_BASE
-from utils import run_cmd
+from config import ARIA2_BIN, ARIA2_BASE, ARIA2_RPC_POLL_SEC, ARIA_X_MAX, ARIA_S_MAX, ARIA2_OUTPUT_TAIL_LINES
+from utils import run_cmd, decode_output, retry_after_seconds
+from aria2_rpc import ensure_daemon, rpc_call
+from ia_client import RATE_GATE
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# OUTPUT DIRECTORIES
+# ============================================================================
+
+# Directories we already created during this run
+# Once a directory exists there's no need to ask the OS to create it again
+_CREATED_DIRS: Set[str] = set()
+
+def _ensure_dir(out_dir: Union[str, Path]) -> None:
+    """
+    Create a download directory, skipping the mkdir call if we already did it.
+    
+    Args:
+        out_dir (Union[str, Path]): The directory to create
+    
+    mkdir with exist_ok=True is harmless to repeat, so two workers racing
+    on the same directory is fine - at worst both call it once.
+    """
+    key = str(out_dir)
+    if key not in _CREATED_DIRS:
+        # makedirs(exist_ok=True) creates all necessary parent directories
+        # and doesn't error if the directory already exists
+        os.makedirs(key, exist_ok=True)
+        _CREATED_DIRS.add(key)
 
 # ============================================================================
 # ERROR ANALYSIS
 # ============================================================================
 
+# Every rate limiting phrase in one compiled pattern, so checking an error
+# message is a single pass over the text (no lowercased copy needed)
+_RATE_RE = re.compile(r"(?i)\b(429|too many requests|503|slowdown|service temporarily unavailable)\b")
+
+# A "Retry-After: ..." header echoed in aria2's output (seconds or an HTTP date)
+_RETRY_AFTER_RE = re.compile(r"(?i)retry-after:\s*([^\r\n]+)")
+
 def rate_limited_errtext(s: str) -> Optional[int]:
     """
     Analyze aria2 error text to detect rate limiting.
@@ -39,7 +80,8 @@ def rate_limited_errtext(s: str) -> Optional[int]:
         Optional[int]: Suggested backoff time in seconds, or None if not rate limited
     
     This function looks for common rate limiting indicators in aria2 error messages.
-    When it finds them, it suggests how long to wait before retrying.
+    When it finds them, it suggests how long to wait before retrying: what the
+    server's Retry-After header said, if aria2 printed it, otherwise 90 seconds.
     
     Example:
         backoff = rate_limited_errtext("HTTP 429 Too Many Requests")
@@ -47,18 +89,13 @@ def rate_limited_errtext(s: str) -> Optional[int]:
             print(f"Rate limited, wait {backoff} seconds")
     """
     
-    # Convert to lowercase for easier pattern matching
-    text = s.lower()
-    
-    # Check for HTTP 429 (Too Many Requests)
-    if "429" in text or "too many requests" in text:
-        return 90  # Wait 90 seconds
-    
-    # Check for HTTP 503 (Service Unavailable) and similar messages
-    if ("503" in text or 
-        "slowdown" in text or 
-        "service temporarily unavailable" in text):
-        return 90  # Wait 90 seconds
+    # One case-insensitive scan for any of the rate limiting indicators:
+    # - HTTP 429 (Too Many Requests)
+    # - HTTP 503 (Service Unavailable) and similar messages
+    if _RATE_RE.search(s):
+        # Did the server say how long to wait?
+        m = _RETRY_AFTER_RE.search(s)
+        return retry_after_seconds(m.group(1).strip() if m else None, default=90)
     
     # No rate limiting detected
     return None
@@ -67,15 +104,34 @@ def rate_limited_errtext(s: str) -> Optional[int]:
 # DOWNLOAD EXECUTION
 # ============================================================================
 
-async def aria2_download(url: str, out_dir: Path, x: int, s: int) -> Tuple[bool, str]:
+def _clamp_connections(x: int, s: int) -> Tuple[int, int]:
+    """
+    Keep the aria2 connection (-x) and split (-s) counts within safe limits.
+    
+    Args:
+        x (int): Requested connections per server
+        s (int): Requested splits
+    
+    Returns:
+        Tuple[int, int]: (x, s) clamped to 1..ARIA_X_MAX and 1..ARIA_S_MAX
+    
+    Prints a warning when a value had to be changed.
+    """
+    cx = max(1, min(x, ARIA_X_MAX))
+    cs = max(1, min(s, ARIA_S_MAX))
+    if (cx, cs) != (x, s):
+        logger.warning("[warn] aria2 -x %d -s %d out of range, using -x %d -s %d", x, s, cx, cs)
+    return cx, cs
+
+async def aria2_download(url: str, out_dir: Union[str, Path], x: int, s: int) -> Tuple[bool, str]:
     """
-    Download a file using aria2 with specified settings.
+    Download a file using the shared aria2 RPC daemon with specified settings.
     
     Args:
         url (str): The URL of the file to download
-        out_dir (Path): Directory to save the file in
-        x (int): Number of connections per server (-x parameter)
-        s (int): Number of splits (-s parameter)
+        out_dir (Union[str, Path]): Directory to save the file in
+        x (int): Number of connections per server (max-connection-per-server)
+        s (int): Number of splits (split)
     
     Returns:
         Tuple[bool, str]: (success, error_message)
@@ -84,9 +140,17 @@ async def aria2_download(url: str, out_dir: Path, x: int, s: int) -> Tuple[bool,
     
     This function:
     1. Creates the output directory if it doesn't exist
-    2. Builds the aria2 command with all necessary parameters
-    3. Runs aria2 and waits for it to complete
-    4. Returns success/failure status
+    2. Makes sure the aria2 daemon is running (starts it on first use)
+    3. Hands the URL to the daemon with aria2.addUri
+    4. Asks the daemon for the download status until it finishes
+    5. Returns success/failure status
+    
+    Only the start of the download is paced by RATE_GATE (one token, like
+    any other request to IA). The transfer itself doesn't hold a request
+    slot: a download can take minutes, and those slots are meant for
+    short API requests - holding one would let a few "slow down" answers
+    shrink the number of downloads below the worker count. How many
+    downloads run at once is up to the scheduler's workers instead.
     
     Example:
         success, error = await aria2_download(
@@ -101,38 +165,281 @@ async def aria2_download(url: str, out_dir: Path, x: int, s: int) -> Tuple[bool,
             print(f"Download failed: {error}")
     """
     
-    # Step 1: Ensure the output directory exists
-    # mkdir(parents=True, exist_ok=True) creates all necessary parent directories
-    # and doesn't error if the directory already exists
-    out_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Step 2: Build the aria2 command
-    # Start with the aria2 binary name
-    args = [ARIA2_BIN]
-    
-    # Add all the base arguments (from config.py)
-    args.extend(ARIA2_BASE)
-    
-    # Add the connection and split parameters
-    args.extend([
-        "--max-connection-per-server", str(x),  # Maximum connections to server
-        "-x", str(x),  # Number of connections (same as above)
-        "-s", str(s),  # Number of splits
-        "-j", "1",     # Download only 1 file at a time
-        "--dir", str(out_dir),  # Output directory
-        url            # The URL to download
-    ])
-    
-    # Step 3: Execute the aria2 command
-    # run_cmd runs the command and captures all output
-    returncode, out, err = await run_cmd(args)
-    
-    # Step 4: Check the result
-    if returncode == 0:
-        # aria2 returned 0, which means success
-        return True, ""
-    else:
-        # aria2 returned non-zero, which means failure
-        # Return the error message (prefer stderr, fall back to stdout)
-        error_msg = err.strip() or out.strip()
-        return False, error_msg
+    # Step 1: Ensure the output directory exists and the settings are sane
+    _ensure_dir(out_dir)
+    x, s = _clamp_connections(x, s)
+    
+    # Step 2: Wait for our turn to start a request, then let aria2 work
+    # (a rate limited download makes the caller back off - see RATE_GATE.backoff)
+    await RATE_GATE.pace()
+    return await _rpc_download(url, out_dir, x, s)
+
+async def _rpc_download(url: str, out_dir: Union[str, Path], x: int, s: int) -> Tuple[bool, str]:
+    """
+    Run one download on the aria2 RPC daemon and wait for it to finish.
+    
+    Takes the same arguments and returns the same (success, error_message)
+    pair as aria2_download, which paces it with the rate gate.
+    """
+    
+    # Make sure the daemon is up (only the first call actually starts it)
+    await ensure_daemon()
+    
+    # Submit the download
+    # The per-download options are the same ones we used to pass on the command line
+    gid = await rpc_call("aria2.addUri", [url], {
+        "dir": str(out_dir),                   # Output directory
+        "max-connection-per-server": str(x),   # Maximum connections to server
+        "split": str(s),                       # Number of splits
+    })
+    
+    finished = False
+    try:
+        # Poll the download status until aria2 is done with it
+        while True:
+            st = await rpc_call("aria2.tellStatus", gid, ["status", "errorCode", "errorMessage"])
+            status = st.get("status")
+            
+            if status == "complete":
+                # aria2 finished the file
+                finished = True
+                return True, ""
+            
+            if status in ("error", "removed"):
+                # aria2 gave up on the file
+                # Return its error message (fall back to the error code)
+                finished = True
+                error_msg = st.get("errorMessage") or f"status={status} errorCode={st.get('errorCode')}"
+                return False, error_msg
+            
+            # Still "active", "waiting" or "paused" - check again shortly
+            await asyncio.sleep(ARIA2_RPC_POLL_SEC)
+    finally:
+        # Clean up the daemon's bookkeeping for this download
+        # If we're leaving early (e.g. Ctrl+C), stop the download first
+        try:
+            if not finished:
+                await rpc_call("aria2.forceRemove", gid)
+            await rpc_call("aria2.removeDownloadResult", gid)
+        except Exception:
+            # Cleanup is best-effort - the daemon may already be gone
+            pass
+
+# ============================================================================
+# BATCH DOWNLOAD EXECUTION
+# ============================================================================
+
+# How much of the end of aria2's output we keep as the error message
+# Error dumps can be huge, and the last few KB always hold the reason
+_ERR_TAIL_BYTES = 4096
+
+# One row of the "Download Results" table aria2 prints with --download-result=full:
+#     ee3c52|OK  |   2.1MiB/s|100|/dl/item/a.mp4
+# gid, status (OK, ERR, RM, INPR, ...), average speed, percent done, then
+# the file path
+_RESULT_RE = re.compile(r"^([0-9a-f]{6})\|([A-Z]+)\s*\|[^|]*\|\s*\d+\|(.*)$")
+
+def _parse_download_results(text: str, by_path: Dict[str, str]) -> Dict[str, bool]:
+    """
+    Read the per-file outcome out of aria2's "Download Results" table.
+    
+    Args:
+        text (str): aria2's console output
+        by_path (Dict[str, str]): Output file path -> the URL downloaded to it
+    
+    Returns:
+        Dict[str, bool]: url -> True (status OK) or False (any other status),
+        for the URLs the table mentioned
+    """
+    found: Dict[str, bool] = {}
+    for ln in text.splitlines():
+        m = _RESULT_RE.match(ln)
+        if not m:
+            continue
+        url = by_path.get(m.group(3).strip())
+        if url is not None:
+            found[url] = m.group(2) == "OK"
+    return found
+
+# aria2's log: each entry starts with a timestamp line, and an error's
+# exception trace follows on lines of their own, e.g.
+#     2024-05-01 12:00:00.123456 [ERROR] [AbstractCommand.cc:351] CUID#7 - Download aborted. URI=https://...
+#     Exception: [AbstractCommand.cc:351] errorCode=22 URI=https://...
+#       -> [HttpSkipResponseCommand.cc:218] errorCode=22 The response status is not successful. status=503
+_LOG_ENTRY_RE = re.compile(r"^\d{4}-\d{2}-\d{2} ")
+_LOG_URI_RE = re.compile(r"URI=(\S+)")
+
+def _parse_error_log(text: str, urls: Set[str]) -> Dict[str, str]:
+    """
+    Find the error aria2 logged for each download in a batch run.
+    
+    Args:
+        text (str): The contents of aria2's --log file
+        urls (Set[str]): Every URL in the batch
+    
+    Returns:
+        Dict[str, str]: url -> its last logged error (entry and trace),
+        for the URLs the log mentioned
+    
+    Each URL in a batch is unique, so the "URI=..." in an entry tells us
+    whose error it is. That way one file's 503 isn't pinned on the others.
+    archive.org/download/... redirects to a storage server
+    (.../items/<identifier>/<file>), so an address we didn't send is
+    matched by the "<identifier>/<file>" part it ends with.
+    """
+    errors: Dict[str, str] = {}
+    entry: List[str] = []
+    
+    # "<identifier>/<file>" -> our URL, for matching redirected addresses
+    tails = {url.partition("/download/")[2]: url for url in urls if "/download/" in url}
+    
+    def finish() -> None:
+        block = "\n".join(entry)
+        m = _LOG_URI_RE.search(block)
+        if not m:
+            return
+        uri = m.group(1)
+        url = uri if uri in urls else next(
+            (u for tail, u in tails.items() if uri.endswith("/" + tail)), None)
+        if url is not None:
+            errors[url] = block[-_ERR_TAIL_BYTES:]
+    
+    for ln in text.splitlines():
+        if _LOG_ENTRY_RE.match(ln) and entry:
+            finish()
+            entry = []
+        entry.append(ln)
+    if entry:
+        finish()
+    return errors
+
+async def aria2_download_batch(jobs: List[Tuple[str, Union[str, Path], str]], x: int, s: int,
+                               j: int) -> Dict[str, Tuple[bool, str]]:
+    """
+    Download many files with a single aria2c run using an input file.
+    
+    Args:
+        jobs (List[Tuple[str, Union[str, Path], str]]): (url, out_dir, out_name) for each file
+        x (int): Number of connections per server (-x parameter)
+        s (int): Number of splits (-s parameter)
+        j (int): How many files aria2 downloads at the same time (-j parameter)
+    
+    Returns:
+        Dict[str, Tuple[bool, str]]: Maps each url to (success, error_message),
+        the same pair aria2_download returns for a single file
+    
+    Instead of one aria2c per file, we write every job into an aria2 input file
+    and let aria2 schedule the downloads itself. When it's done, aria2 prints
+    a "Download Results" table with the outcome of every file, which is what
+    we go by. If a file isn't in the table (say, the output got cut short),
+    we fall back to the session file: aria2 saves every download it could not
+    finish there when it exits, so any URL found in that file failed.
+    
+    A failed file's error message is the one aria2 logged for that file
+    (we run it with --log). When the log doesn't say, the message is a
+    neutral "aria2c reported ERR" - never the whole run's output, which
+    may be about some other file (a single 503 would otherwise make every
+    failed file look rate limited).
+    
+    Keep batches to ARIA2_BATCH_SIZE files, so the whole results table fits
+    in the output we keep.
+    
+    Example:
+        results = await aria2_download_batch(
+            [("https://archive.org/download/item/file.mp4", Path("./downloads/item"), "file.mp4")],
+            8, 8, 4
+        )
+        ok, error = results["https://archive.org/download/item/file.mp4"]
+    """
+    
+    results: Dict[str, Tuple[bool, str]] = {}
+    if not jobs:
+        return results
+    
+    x, s = _clamp_connections(x, s)
+    
+    with tempfile.TemporaryDirectory(prefix="iagrab-") as tmp:
+        input_path = Path(tmp) / "jobs.txt"
+        session_path = Path(tmp) / "session.txt"
+        log_path = Path(tmp) / "aria2.log"
+        
+        # Step 1: Write the aria2 input file
+        # Format: the URL on its own line, then indented per-download options
+        lines = []
+        for url, out_dir, out_name in jobs:
+            _ensure_dir(out_dir)
+            lines.append(url)
+            lines.append(f"  dir={out_dir}")
+            lines.append(f"  out={out_name}")
+        input_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        
+        # Step 2: Build the aria2 command
+        args = [ARIA2_BIN]
+        args.extend(ARIA2_BASE)
+        args.extend([
+            "--max-connection-per-server", str(x),  # Maximum connections to server
+            "-x", str(x),  # Number of connections (same as above)
+            "-s", str(s),  # Number of splits
+            "-j", str(j),  # Files downloaded at the same time
+            "-i", str(input_path),               # The jobs we just wrote
+            "--save-session", str(session_path),  # Where unfinished downloads get listed
+            "--save-session-interval=5",
+            "--download-result=full",  # Results table with every file's outcome
+            "--log", str(log_path),    # Per-download errors, so we know whose they are
+            "--log-level=error",
+        ])
+        
+        # Step 3: Execute aria2 once for the whole batch
+        # Starting the run is paced like a single request (which also waits
+        # out any backoff); the run itself holds no rate gate slot, for the
+        # same reason as in aria2_download
+        await RATE_GATE.pace()
+        # aria2 can print a lot over a long run; we only need the end
+        returncode, out, err = await run_cmd(args, tail=ARIA2_OUTPUT_TAIL_LINES)
+        error_msg = ""
+        if returncode != 0:
+            # Only a failed run needs its output looked at, and only the
+            # end of it - that's where aria2 prints why it stopped
+            error_msg = (decode_output(err[-_ERR_TAIL_BYTES:]).strip()
+                         or decode_output(out[-_ERR_TAIL_BYTES:]).strip())
+        
+        # Step 4: Find out which URLs did not finish
+        # Session file lines that don't start with whitespace hold the URIs
+        # (tab separated); indented lines are that download's options
+        unfinished = set()
+        session_ok = session_path.exists()
+        if session_ok:
+            for ln in session_path.read_text(encoding="utf-8", errors="replace").splitlines():
+                if ln and not ln[0].isspace():
+                    unfinished.update(ln.split("\t"))
+        
+        # Each failed download's own error, from aria2's log
+        urls = {url for url, _, _ in jobs}
+        logged = _parse_error_log(
+            log_path.read_text(encoding="utf-8", errors="replace") if log_path.exists() else "", urls)
+    
+    # Step 5: Map every URL to a result
+    # The results table comes first; the session file and exit code only
+    # decide for files the table didn't mention
+    by_path = {str(Path(out_dir) / out_name): url for url, out_dir, out_name in jobs}
+    table = _parse_download_results(decode_output(out), by_path)
+    
+    for url, _, _ in jobs:
+        ok = table.get(url)
+        if ok is None:
+            if returncode == 0:
+                ok = True
+            elif not session_ok:
+                # No session file means aria2 failed before it even started,
+                # so the run's own error is every file's error
+                results[url] = (False, error_msg or f"aria2c exited with code {returncode}")
+                continue
+            else:
+                ok = url not in unfinished
+        
+        if ok:
+            results[url] = (True, "")
+        else:
+            results[url] = (False, logged.get(url) or "aria2c reported ERR")
+    
+    return results
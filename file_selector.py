@@ -16,24 +16,55 @@ It also checks if we already have the file locally to avoid re-downloading.
 # IMPORTS
 # ============================================================================
 
+import asyncio
+import os
 from pathlib import Path  # For working with file paths
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple, Union
 
 # Import our configuration
 from config import VIDEO_EXTS, AUDIO_EXTS, AUDIO_PREFS
 from utils import _size_int
 
+# ============================================================================
+# FILE TYPE TABLES
+# ============================================================================
+# Built once when the module loads, instead of on every pick_best_file call
+
+# Non-media files that we never want to download
+# These are usually metadata, text files, or compressed archives
+SKIP_EXTS = frozenset({".txt", ".xml", ".json", ".gz", ".zip", ".sha1", ".md5", ".srt", ".vtt", ".nfo"})
+
+# What kind of file each extension is, so one dict lookup per file answers
+# "skip it?", "video?" and "audio?" all at once
+# Extensions that aren't in here are neither media nor on the skip list
+# Later loops overwrite earlier ones, giving the same priority as before:
+# skip beats video, and video beats audio
+EXT_KIND: Dict[str, str] = {}
+for _e in AUDIO_EXTS:
+    EXT_KIND[_e] = "audio"
+for _e in VIDEO_EXTS:
+    EXT_KIND[_e] = "video"
+for _e in SKIP_EXTS:
+    EXT_KIND[_e] = "skip"
+del _e
+
+# How much we like each audio format: 0 is the most preferred (AUDIO_PREFS
+# order), and every format not in AUDIO_PREFS shares the last place
+AUDIO_PREF_IDX: Dict[str, int] = {ext: i for i, ext in enumerate(AUDIO_PREFS)}
+AUDIO_OTHER_RANK = len(AUDIO_PREFS)
+
 # ============================================================================
 # FILE SELECTION LOGIC
 # ============================================================================
 
-def pick_best_file(files: List[Dict], media_mode: str) -> Tuple[Optional[Dict], Optional[str]]:
+def pick_best_file(files: Iterable[Dict], media_mode: str) -> Tuple[Optional[Dict], Optional[str]]:
     """
     Choose the best file to download from a list of available files.
     
     Args:
-        files (List[Dict]): List of file metadata dictionaries from IA
-                           Each dict has keys like "name", "size", "format"
+        files (Iterable[Dict]): File metadata dictionaries from IA (any iterable;
+                               it's only walked once). Each dict has keys like
+                               "name", "size", "format"
         media_mode (str): "video", "audio", or "both" - what we're looking for
     
     Returns:
@@ -47,6 +78,14 @@ def pick_best_file(files: List[Dict], media_mode: str) -> Tuple[Optional[Dict],
     3. Choose the largest file of the preferred type
     4. For audio, prefer certain formats over others
     
+    All of this happens in a single pass over the files: we keep the best
+    video and the best audio file, updating them as we go. The best audio
+    file is the one with the most preferred format (AUDIO_PREF_IDX), and
+    the largest among files of that format. Sizes are compared as plain
+    numbers (unknown counts as 0), and the result dict for a file is only
+    built when it becomes the new best. On ties the first file listed
+    wins, the same result max() would give.
+    
     Example:
         files = [
             {"name": "movie.mp4", "size": "1000000", "format": "MPEG4"},
@@ -57,9 +96,14 @@ def pick_best_file(files: List[Dict], media_mode: str) -> Tuple[Optional[Dict],
         # Returns ({"name": "movie.mp4", ...}, None) - video file selected
     """
     
-    # Step 1: Create a list of candidate files
-    # We'll analyze each file and decide if it's worth considering
-    cands = []
+    # The best files seen so far, each with its size (unknown = 0) so we
+    # can compare against it without looking inside the dict
+    best_video = None       # Largest video file
+    best_video_size = 0
+    best_audio = None       # Most preferred format, then largest audio file
+    best_audio_rank = AUDIO_OTHER_RANK
+    best_audio_size = 0
+    has_candidates = False  # Did we see any file worth considering at all?
     
     for f in files:
         # Get the filename from the file metadata
@@ -70,76 +114,77 @@ def pick_best_file(files: List[Dict], media_mode: str) -> Tuple[Optional[Dict],
             continue
         
         # Get the file extension (like .mp4, .wav, etc.)
-        ext = Path(name).suffix.lower()
+        # Same result as Path(name).suffix.lower(), but plain string slicing
+        # avoids building a Path object for every file in the item
+        base = name[name.rfind("/") + 1:]  # Last path component only
+        i = base.rfind(".")
+        ext = base[i:].lower() if 0 < i < len(base) - 1 else ""
+        
+        # One lookup tells us what kind of file this is
+        kind = EXT_KIND.get(ext)
         
         # Skip non-media files that we don't want to download
-        # These are usually metadata, text files, or compressed archives
-        if ext in {".txt", ".xml", ".json", ".gz", ".zip", ".sha1", ".md5", ".srt", ".vtt", ".nfo"}:
+        if kind == "skip":
+            continue
+        
+        has_candidates = True
+        
+        # Only video and audio files can be chosen, so only they need a size
+        # and a candidate entry
+        if kind is None:
             continue
         
-        # Get the file size and convert to integer
-        size = _size_int(f.get("size"))
+        # Get the file size as an integer
+        # IA sends sizes as strings of digits, so handle that case inline and
+        # only fall back to the slower _size_int for anything unusual
+        raw = f.get("size")
+        if raw.__class__ is str and raw.isdecimal():
+            size = int(raw)
+        elif raw is None:
+            size = None
+        else:
+            size = _size_int(raw)
+        
+        # Strictly bigger replaces the current best, so ties keep the first file
+        key = size or 0
+        
+        if kind == "video":
+            if best_video is None or key > best_video_size:
+                best_video = {"name": name, "ext": ext, "size": size, "format": f.get("format")}
+                best_video_size = key
         
-        # Add this file to our candidates list
-        cands.append({
-            "name": name,
-            "ext": ext,
-            "size": size,
-            "format": f.get("format")
-        })
+        else:
+            # Audio: a better format always wins, the same format needs a bigger size
+            rank = AUDIO_PREF_IDX.get(ext, AUDIO_OTHER_RANK)
+            if (best_audio is None or rank < best_audio_rank
+                    or (rank == best_audio_rank and key > best_audio_size)):
+                best_audio = {"name": name, "ext": ext, "size": size, "format": f.get("format")}
+                best_audio_rank = rank
+                best_audio_size = key
     
     # If no candidates found, return None with reason
-    if not cands:
+    if not has_candidates:
         return None, "no_candidate_files"
     
-    # Step 2: Separate files by type
-    # Create lists of video and audio files from our candidates
-    videos = [c for c in cands if c["ext"] in VIDEO_EXTS]
-    audios = [c for c in cands if c["ext"] in AUDIO_EXTS]
-    
-    # Step 3: Choose based on media mode
+    # Choose based on media mode
     if media_mode == "video":
         # We only want video files
-        if not videos:
+        if not best_video:
             return None, "filtered_out_no_video"
-        
-        # Choose the largest video file
-        # max() with key=lambda finds the item with the highest "size" value
-        # If size is None, it's treated as 0
-        return max(videos, key=lambda c: c["size"] or 0), None
+        return best_video, None
     
     elif media_mode == "audio":
         # We only want audio files
-        if not audios:
+        if not best_audio:
             return None, "filtered_out_no_audio"
-        
-        # For audio, we have preferences for certain formats
-        # Try each preferred format in order
-        for ext in AUDIO_PREFS:
-            # Find all audio files with this preferred extension
-            subset = [a for a in audios if a["ext"] == ext]
-            if subset:
-                # Found files with this preferred format
-                # Choose the largest one
-                return max(subset, key=lambda c: c["size"] or 0), None
-        
-        # No preferred formats found, choose the largest audio file overall
-        return max(audios, key=lambda c: c["size"] or 0), None
+        return best_audio, None
     
     else:
         # "both" mode - prefer video, fall back to audio
-        if videos:
-            # We have video files, choose the largest
-            return max(videos, key=lambda c: c["size"] or 0), None
-        
-        if audios:
-            # No video files, but we have audio files
-            # Use the same audio preference logic as audio mode
-            for ext in AUDIO_PREFS:
-                subset = [a for a in audios if a["ext"] == ext]
-                if subset:
-                    return max(subset, key=lambda c: c["size"] or 0), None
-            return max(audios, key=lambda c: c["size"] or 0), None
+        if best_video:
+            return best_video, None
+        if best_audio:
+            return best_audio, None
         
         # No video or audio files found
         return None, "no_video_or_audio"
@@ -148,12 +193,35 @@ def pick_best_file(files: List[Dict], media_mode: str) -> Tuple[Optional[Dict],
 # LOCAL FILE CHECKING
 # ============================================================================
 
-def local_already_ok(dest_dir: Path, filename: str, expected_size: Optional[int]) -> bool:
+def local_size(dest_dir: Union[str, Path], filename: str) -> Optional[int]:
+    """
+    Get the size of a file we may already have.
+    
+    Args:
+        dest_dir (Union[str, Path]): The directory where the file should be
+        filename (str): The name of the file
+    
+    Returns:
+        Optional[int]: The file's size in bytes, or None if it isn't there
+                       (or can't be checked - permissions, a bad name, etc.)
+    """
+    # Build the full path to where the file should be
+    # A plain string join is cheaper than building another Path object
+    # (os.path.join accepts a Path too, and always hands back a string)
+    target = os.path.join(dest_dir, filename)
+    
+    try:
+        # A single stat() both checks that the file exists and gets its size
+        return os.stat(target).st_size
+    except (OSError, ValueError):
+        return None
+
+def local_already_ok(dest_dir: Union[str, Path], filename: str, expected_size: Optional[int]) -> bool:
     """
     Check if we already have the file locally and it's the right size.
     
     Args:
-        dest_dir (Path): The directory where the file should be
+        dest_dir (Union[str, Path]): The directory where the file should be
         filename (str): The name of the file to download
         expected_size (Optional[int]): The expected file size in bytes
     
@@ -169,24 +237,40 @@ def local_already_ok(dest_dir: Path, filename: str, expected_size: Optional[int]
             print("File already exists, skipping download")
     """
     
-    # Build the full path to where the file should be
-    target = dest_dir / filename
-    
-    # If the file doesn't exist, we definitely need to download it
-    if not target.exists():
-        return False
-    
     # If we don't know the expected size, we can't verify it's correct
     # In this case, we'll re-download to be safe
     if expected_size is None:
         return False
     
-    try:
-        # Get the actual file size and compare with expected
-        actual_size = target.stat().st_size
-        return actual_size == expected_size
-        
-    except Exception:
-        # Something went wrong checking the file (permissions, etc.)
-        # Assume we need to download it
+    # A missing file has size None, which never equals a real size
+    return local_size(dest_dir, filename) == expected_size
+
+async def local_already_ok_async(dest_dir: Union[str, Path], filename: str, expected_size: Optional[int]) -> bool:
+    """
+    Same check as local_already_ok, but run in a worker thread.
+    
+    Args:
+        dest_dir (Union[str, Path]): The directory where the file should be
+        filename (str): The name of the file to download
+        expected_size (Optional[int]): The expected file size in bytes
+    
+    Returns:
+        bool: True if the file exists and has the expected size, False otherwise
+    
+    stat() is a blocking call, and on network filesystems it can take a
+    while. Running it in a thread keeps the event loop free to carry on
+    with other downloads and metadata requests in the meantime.
+    
+    Example:
+        if await local_already_ok_async(Path("./downloads"), "movie.mp4", 1000000):
+            print("File already exists, skipping download")
+    """
+    # Without an expected size the answer is always False - no need to
+    # start a thread (or stat anything) to find that out
+    if expected_size is None:
         return False
+    return await asyncio.to_thread(local_already_ok, dest_dir, filename, expected_size)
+
+async def local_size_async(dest_dir: Union[str, Path], filename: str) -> Optional[int]:
+    """Same as local_size, but run in a worker thread (see local_already_ok_async)."""
+    return await asyncio.to_thread(local_size, dest_dir, filename)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+SHARED HTTP CLIENT MODULE
+=========================
+
+This module owns the ONE HTTP session the whole program uses to talk to
+archive.org. It's responsible for:
+1. Creating the session the first time someone needs it
+2. Keeping connections (and DNS lookups) alive between requests
+3. Closing everything down when the program finishes
+
+Think of this as keeping a phone line to archive.org open, instead of
+hanging up and redialing for every single question we ask.
+
+The session needs the optional "aiohttp" package. Without it,
+HTTP_AVAILABLE is False and callers use the "ia" command-line tool instead.
+"""
+
+# ============================================================================
+# IMPORTS
+# ============================================================================
+
+import asyncio
+
+# aiohttp is optional - without it we use the "ia" command-line tool instead
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Import our configuration
+from config import (
+    IA_HTTP_CONNECTIONS, HTTP_DNS_CACHE_SEC, HTTP_KEEPALIVE_SEC, HTTP_TIMEOUT_SEC, USER_AGENT,
+)
+
+# True when we can make HTTP requests ourselves
+HTTP_AVAILABLE = aiohttp is not None
+
+# The exceptions a request raises when the network (not the server's answer)
+# is the problem: connection refused or reset, DNS failure, a body cut off
+# halfway, or the session timeout. Callers catch these to retry or report
+# the failure nicely. Empty without aiohttp, so "except TRANSPORT_ERRORS"
+# still works (it then catches nothing).
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp is not None else ()
+
+# ============================================================================
+# SHARED SESSION
+# ============================================================================
+# One shared session means one pool of kept-alive connections, so we only pay
+# the TCP + TLS handshake once per connection instead of once per request.
+
+_SESSION = None
+
+async def session():
+    """
+    Get the shared aiohttp session, creating it on first use.
+    
+    Returns:
+        aiohttp.ClientSession: The session all IA HTTP requests go through
+    
+    Example:
+        s = await session()
+        async with s.get("https://archive.org/metadata/movie123") as r:
+            data = await r.json()
+    """
+    global _SESSION
+    
+    # No await between the check and the assignment, so two callers
+    # can't both create a session
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=IA_HTTP_CONNECTIONS,           # Maximum open connections
+                limit_per_host=IA_HTTP_CONNECTIONS,  # ...all of which may go to archive.org
+                ttl_dns_cache=HTTP_DNS_CACHE_SEC,    # Reuse DNS answers for a while
+                keepalive_timeout=HTTP_KEEPALIVE_SEC,  # Keep idle connections open
+            ),
+            headers={"User-Agent": USER_AGENT},
+            # A stuck request fails after a while instead of holding its
+            # slot forever (aiohttp's own default is 5 minutes)
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SEC),
+        )
+    return _SESSION
+
+async def shutdown() -> None:
+    """
+    Close the shared HTTP session (if one was opened).
+    
+    This should be called once when the program finishes.
+    It's safe to call even if no request was ever made.
+    """
+    global _SESSION
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
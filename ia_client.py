@@ -5,10 +5,14 @@ INTERNET ARCHIVE API CLIENT MODULE
 
 This module handles all communication with the Internet Archive (IA).
 It's responsible for:
-1. Searching for items in collections
-2. Fetching metadata about items
+1. Searching for items in collections (and their file lists, when IA includes them)
+2. Fetching metadata about items (and caching it on disk)
 3. Being polite to IA servers (rate limiting)
 
+When the optional "aiohttp" package is installed, we call IA's HTTP APIs
+directly over the shared, kept-alive session from http_client.py. Otherwise we fall back
+to running the "ia" command-line tool for each request.
+
 Think of this as the "translator" between our program and the Internet Archive.
 It knows how to talk to IA's servers and handles all the web requests.
 """
@@ -19,52 +23,192 @@ It knows how to talk to IA's servers and handles all the web requests.
 
 import json              # For parsing JSON responses from IA
 import asyncio           # For async operations
+import functools         # For the in-memory cache of parsed entries
+import logging           # For progress and warning messages
+import os
+import random            # For spreading out retries
+import tempfile          # For atomic cache writes
 import time              # For timing and delays
-from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# orjson is optional - a much faster JSON parser (written in C/Rust) for the
+# big metadata documents. Without it we use Python's built-in json module.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ijson is optional - it parses JSON bit by bit as it arrives. With it we
+# read just the "files" list out of a metadata answer while it downloads,
+# without holding the whole (sometimes many-megabyte) document in memory.
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # Import our own modules
-from config import IA_BIN  # The IA command-line tool name
-from utils import run_cmd, looks_like_identifier  # Helper functions
+from config import (
+    IA_BIN,  # The IA command-line tool name
+    IA_SCRAPE_URL, IA_METADATA_URL, IA_SCRAPE_PAGE_SIZE, IA_SCRAPE_FILES_PAGE_SIZE, IA_PREFETCH_CHUNK,
+    META_CONCURRENCY, AIMD_START_LIMIT, AIMD_MIN_LIMIT, AIMD_MAX_LIMIT,
+    IA_REQUEST_RATE, IA_REQUEST_BURST, IA_REQUEST_RATE_MIN, IA_REQUEST_RATE_STEP,
+    META_CACHE_DIR, META_CACHE_TTL_SEC,
+    IA_RETRY_ATTEMPTS, IA_RETRY_BASE_SEC, IA_RETRY_MAX_SEC,
+)
+from utils import run_cmd, decode_output, clean_identifiers, retry_after_seconds  # Helper functions
+from http_client import session, HTTP_AVAILABLE, TRANSPORT_ERRORS  # The shared HTTP session
+
+logger = logging.getLogger(__name__)
+
+# Whether the "ia" command-line tool is installed (main() checks at startup)
+# It's only a fallback when aiohttp is available, so it may well be missing
+IA_CLI_AVAILABLE = True
+
+def configure_ia_cli(available: bool) -> None:
+    """
+    Tell this module whether the "ia" command-line tool can be used.
+    
+    Args:
+        available (bool): False if the tool isn't installed
+    """
+    global IA_CLI_AVAILABLE
+    IA_CLI_AVAILABLE = available
 
 # ============================================================================
 # RATE LIMITING SYSTEM
 # ============================================================================
 
-class RateGate:
+class TokenBucket:
     """
-    A shared rate limiting mechanism to be polite to Internet Archive servers.
+    Paces how many requests we start per second.
+    
+    Every request takes one token. Tokens refill at a steady rate, and up to
+    'burst' of them can be saved up while we're quiet. If a token is there,
+    the request goes out right away; if not, it waits exactly until the next
+    token is due. So we only ever wait when we'd otherwise be going too fast.
     
-    This class ensures that if we get rate limited (server says "slow down"),
-    all parts of our program wait before making more requests.
+    The rate adapts like RateGate's limit: slow_down() halves it,
+    speed_up() adds a little back, never beyond the starting rate.
     
-    Think of it like a traffic light that all our requests check before proceeding.
+    hold() pauses it: the bucket goes "into debt" by as many tokens as
+    would refill in that time, so every request waits for the debt to be
+    paid off first. Requests still don't wait on each other - they just
+    line up one token apart once the pause is over.
     """
     
-    def __init__(self):
+    def __init__(self, rate: float = IA_REQUEST_RATE, burst: int = IA_REQUEST_BURST,
+                 min_rate: float = IA_REQUEST_RATE_MIN, step: float = IA_REQUEST_RATE_STEP):
         """
-        Initialize the rate gate.
+        Args:
+            rate (float): Tokens per second (also the highest rate we grow back to)
+            burst (int): Most tokens that can be saved up
+            min_rate (float): slow_down() never goes below this
+            step (float): How much speed_up() adds to the rate
+        """
+        self._max_rate = rate
+        self._rate = rate
+        self._burst = burst
+        self._min_rate = min_rate
+        self._step = step
+        self.reset()
+    
+    def reset(self) -> None:
+        """
+        Empty the bucket down to a single token, starting from now.
+        
+        The schedulers call this (through RateGate.reset) right before the
+        resolvers start. With one token, not a full bucket, their first
+        requests go out one token apart (a fixed, even stagger) instead of
+        all together. Resetting at creation alone isn't enough: the bucket
+        refills to 'burst' while the user answers the startup questions.
+        Only this first wave is spread out - later items are staggered by
+        when they finish.
+        """
+        self._tokens = 1.0
+        self._stamp = time.monotonic()   # When we last topped up the tokens
+    
+    def _top_up(self) -> None:
+        """Add the tokens earned since last time (up to 'burst')."""
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
+    
+    async def acquire(self) -> None:
+        """Take a token, waiting until one is due if the bucket is empty."""
+        self._top_up()
+        
+        # Take our token right away, even if that puts the bucket "in debt"
+        # Everyone after us then sees the debt and waits longer, so waiting
+        # requests line up one token apart instead of all waking at once
+        # (no await happens between reading and updating, so this is safe)
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self._rate)
+    
+    def hold(self, seconds: float) -> None:
+        """
+        Let no request start for the next 'seconds' seconds.
         
-        _until: The timestamp when we can start making requests again
-        _lock: A lock to prevent multiple parts of the program from
-               updating the rate limit at the same time
+        An existing longer pause is kept, so several pauses at once
+        combine into the longest one.
         """
-        self._until = 0.0  # When we can resume (0.0 means no delay)
-        self._lock = asyncio.Lock()  # Thread-safe lock for updates
+        self._top_up()
+        self._tokens = min(self._tokens, -seconds * self._rate)
+    
+    def slow_down(self) -> None:
+        """The server said "slow down": halve the rate."""
+        self._rate = max(self._min_rate, self._rate / 2)
+    
+    def speed_up(self) -> None:
+        """A request went fine: grow the rate back a little."""
+        self._rate = min(self._max_rate, self._rate + self._step)
+
+class RateGate:
+    """
+    A shared rate limiting mechanism to be polite to Internet Archive servers.
+    
+    This class does three jobs:
+    1. If we get rate limited (server says "slow down"), all parts of our
+       program wait before making more requests (backoff)
+    2. It limits how many requests to IA run at the same time, and adapts that
+       limit to how the server is coping (slot/acquire/release):
+       - every successful "round" of requests raises the limit by one
+       - every "slow down" answer halves it
+       This is the same AIMD scheme TCP uses, so we settle near what the
+       server can actually handle instead of a fixed guess.
+    3. It paces how many requests start per second with a TokenBucket
+       (pace), whose rate adapts the same way
     
-    async def wait_if_needed(self):
+    Think of it like a traffic light that all our requests check before proceeding,
+    plus a car park that gets bigger or smaller depending on the traffic.
+    """
+    
+    def __init__(self, limit: int = AIMD_START_LIMIT, min_limit: int = AIMD_MIN_LIMIT,
+                 max_limit: int = AIMD_MAX_LIMIT):
         """
-        Wait if we're currently rate limited.
+        Initialize the rate gate.
+        
+        Args:
+            limit (int): How many requests may run at once to begin with
+            min_limit (int): The limit never drops below this
+            max_limit (int): The limit never rises above this
         
-        If the server told us to wait, this function will pause the program
-        until it's okay to make more requests.
+        _cond: Lets waiting requests sleep until a slot frees up
         """
-        # Calculate how long we need to wait
-        delay = self._until - time.time()
+        self._limit = limit          # Requests currently allowed in flight
+        self._min = min_limit
+        self._max = max_limit
+        self._inflight = 0           # Requests currently in flight
+        self._success_since_decrease = 0  # Successful requests since the last change
+        self._cond = asyncio.Condition()
         
-        if delay > 0:
-            # We need to wait
-            print(f"[pause] Backing off for {int(delay)}s due to rate limiting")
-            await asyncio.sleep(delay)  # Wait for the specified time
+        self.bucket = TokenBucket()  # Requests per second
+    
+    def reset(self) -> None:
+        """Start request pacing afresh from now (see TokenBucket.reset)."""
+        self.bucket.reset()
     
     async def backoff(self, seconds: int):
         """
@@ -74,24 +218,352 @@ class RateGate:
             seconds (int): How many seconds to wait before making more requests
         
         This is called when the server tells us we're making too many requests.
+        The pause is held by the token bucket, so every request that paces
+        itself (slot() does) waits it out - there's no separate check to
+        make before each request, and nothing to wait for if we don't end
+        up asking IA at all (a cache hit, say).
+        """
+        self.bucket.hold(seconds)
+    
+    async def pace(self):
         """
-        async with self._lock:
-            # Set the wait time, but don't make it shorter than any existing wait
-            # This prevents one part of the program from overriding another's backoff
-            self._until = max(self._until, time.time() + seconds)
+        Wait until we may start another request (see TokenBucket).
+        
+        slot() does this for you; call it directly for requests that
+        don't hold a slot.
+        """
+        await self.bucket.acquire()
+    
+    async def acquire(self):
+        """
+        Wait for a free request slot and take it.
+        
+        Every acquire() must be paired with a release() - use slot() to get
+        that automatically.
+        """
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._inflight < self._limit)
+            self._inflight += 1
+    
+    async def release(self, overloaded: bool, failed: bool = False):
+        """
+        Give a request slot back and adapt the limit.
+        
+        Args:
+            overloaded (bool): True if the server told us to slow down
+            failed (bool): True if the request failed some other way (a
+                           timeout, a 500/502/504...) - that doesn't change
+                           the limit either way, since a failing server is
+                           no reason to send it more
+        """
+        async with self._cond:
+            self._inflight -= 1
+            
+            if overloaded:
+                # Multiplicative decrease: halve the limit
+                # Requests already in flight finish normally; new ones wait
+                # until we're back under the new limit
+                self._limit = max(self._min, self._limit // 2)
+                self._success_since_decrease = 0
+                self.bucket.slow_down()
+            elif not failed:
+                # A success (a failed request is neither - nothing changes)
+                self.bucket.speed_up()
+                # Additive increase: one more slot per full "round" of successes
+                self._success_since_decrease += 1
+                if self._success_since_decrease >= self._limit:
+                    self._limit = min(self._max, self._limit + 1)
+                    self._success_since_decrease = 0
+            
+            # Wake up waiters - a slot is free and the limit may have grown
+            self._cond.notify_all()
+    
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold a request slot for the duration of an "async with" block.
+        
+        Entering the block first waits for the request pacing (pace), then
+        for a free slot.
+        
+        Yields:
+            RateSlot: Set its "overloaded" attribute to True if the server said
+            "slow down", or "failed" if the request failed another way.
+            A RateLimitedError or TransientError escaping the block does
+            this for you.
+        
+        Example:
+            async with RATE_GATE.slot() as slot:
+                ok, err = await do_request()
+                slot.overloaded = is_rate_limited(err)
+        """
+        await self.pace()
+        await self.acquire()
+        slot = RateSlot()
+        try:
+            yield slot
+        except RateLimitedError:
+            slot.overloaded = True
+            raise
+        except TransientError:
+            slot.failed = True
+            raise
+        finally:
+            await self.release(slot.overloaded, slot.failed)
+
+class RateSlot:
+    """
+    One request slot handed out by RateGate.slot().
+    
+    Attributes:
+        overloaded (bool): Whether the request in this slot was told to slow down
+        failed (bool): Whether it failed in some other way (not counted as a success)
+    """
+    
+    def __init__(self):
+        self.overloaded = False
+        self.failed = False
 
 # Create a global rate gate that all parts of the program share
 RATE_GATE = RateGate()
 
+# Limits how many metadata requests are in flight at once, separately from
+# the (much smaller) number of download workers
+META_SEM = asyncio.Semaphore(META_CONCURRENCY)
 
+class TransientError(RuntimeError):
+    """
+    Raised when a request to IA failed in a way that may well work if retried.
+    
+    That's network trouble (timeouts, dropped connections, DNS failures)
+    and the server errors that mean "not right now" (500, 502, 504).
+    IA answering "slow down" is its own subclass, RateLimitedError.
+    """
+
+class RateLimitedError(TransientError):
+    """
+    Raised when IA answers an HTTP request with 429 or 503 ("slow down").
+    
+    Attributes:
+        seconds (int): How long the server asked us to wait before retrying
+    """
+    
+    def __init__(self, seconds: int):
+        super().__init__(f"rate limited by archive.org (retry after {seconds}s)")
+        self.seconds = seconds
+
+def _json_loads(data):
+    """
+    Parse JSON text (str or bytes) with the fastest parser available.
+    
+    Both parsers accept bytes, so HTTP bodies can be passed in undecoded.
+    
+    Raises:
+        ValueError: If the text isn't valid JSON (both parsers' errors are ValueErrors)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# ============================================================================
+# HTTP REQUESTS
+# ============================================================================
+
+# Server errors worth retrying (429 and 503 are rate limiting, see below)
+_TRANSIENT_STATUS = frozenset((500, 502, 504))
+
+def _check_status(r, url: str) -> None:
+    """
+    Turn an answer that isn't 200 into the matching exception.
+    
+    Args:
+        r: The aiohttp response
+        url (str): The URL we asked for (for the error message)
+    
+    Raises:
+        RateLimitedError: If IA answered 429 or 503
+        TransientError: If IA answered 500, 502 or 504
+        RuntimeError: For any other answer that isn't 200
+    """
+    if r.status == 200:
+        return
+    if r.status in (429, 503):
+        # Server says "slow down" - tell the caller how long to wait
+        raise RateLimitedError(retry_after_seconds(r.headers.get("Retry-After")))
+    if r.status in _TRANSIENT_STATUS:
+        raise TransientError(f"HTTP {r.status} from {url}")
+    raise RuntimeError(f"HTTP {r.status} from {url}")
+
+async def _get_json(url: str, params: Optional[Dict] = None) -> Dict:
+    """
+    Make a GET request to IA and decode the JSON reply.
+    
+    Args:
+        url (str): The URL to fetch
+        params (Optional[Dict]): Query string parameters
+    
+    Returns:
+        Dict: The decoded JSON reply
+    
+    Raises:
+        RateLimitedError: If IA answered 429 or 503
+        TransientError: If IA answered 500/502/504, or the network failed
+        RuntimeError: For any other non-200 answer
+    """
+    http = await session()
+    try:
+        async with http.get(url, params=params) as r:
+            _check_status(r, url)
+            # Parse the raw bytes: orjson reads bytes directly, so we skip
+            # decoding the (possibly multi-megabyte) body into a str first
+            return _json_loads(await r.read())
+    except TRANSPORT_ERRORS as e:
+        raise TransientError(f"{type(e).__name__} while fetching {url}: {e}") from e
+
+async def _stream_files(r) -> Dict:
+    """
+    Read only the "files" list of a metadata answer, parsing as it arrives.
+    
+    Args:
+        r: The aiohttp response (needs the ijson package)
+    
+    Returns:
+        Dict: {"files": [...]}, or {} if the answer had no files
+              (the same {} IA sends for identifiers that don't exist)
+    
+    Every other part of the document is skipped over without being kept.
+    use_float=True gives plain floats instead of Decimals, so the result
+    can still be saved to the cache with json.
+    """
+    files = [f async for f in ijson.items(r.content, "files.item", use_float=True)]
+    return {"files": files} if files else {}
+
+async def _get_json_revalidate(url: str, etag: Optional[str], last_modified: Optional[str],
+                               files_only: bool = False) -> Tuple[Optional[Dict], Optional[str], Optional[str]]:
+    """
+    Make a conditional GET request: send back the validators from our cached copy.
+    
+    Args:
+        url (str): The URL to fetch
+        etag (Optional[str]): The ETag header we saved last time (if any)
+        last_modified (Optional[str]): The Last-Modified header we saved last time (if any)
+        files_only (bool): The answer is item metadata and we only need its
+                           "files" list - stream just that when ijson is installed
+    
+    Returns:
+        Tuple[Optional[Dict], Optional[str], Optional[str]]: (data, etag, last_modified)
+        - data is None when IA answered 304 Not Modified (our copy is still good)
+        - etag/last_modified are the new validators to save with the data
+    
+    Raises:
+        RateLimitedError: If IA answered 429 or 503
+        TransientError: If IA answered 500/502/504, or the network failed
+        RuntimeError: For any other answer that isn't 200 or 304
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    
+    http = await session()
+    try:
+        async with http.get(url, headers=headers) as r:
+            if r.status == 304:
+                # Nothing changed since we saved it - no body was sent
+                return None, etag, last_modified
+            _check_status(r, url)
+            if files_only and ijson is not None:
+                data = await _stream_files(r)
+            else:
+                data = _json_loads(await r.read())
+            return data, r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except TRANSPORT_ERRORS as e:
+        raise TransientError(f"{type(e).__name__} while fetching {url}: {e}") from e
+
+async def _retry_transient(request, what: str):
+    """
+    Run a request, retrying it if it fails with a TransientError.
+    
+    Args:
+        request: A function that starts the request (returns an awaitable);
+                 it's called again for every attempt
+        what (str): What we're fetching (for the warning messages)
+    
+    Returns:
+        Whatever the request returns
+    
+    Raises:
+        RateLimitedError: Straight away - IA said how long to wait, and the
+                          callers handle that with RATE_GATE.backoff
+        TransientError: If the last of IA_RETRY_ATTEMPTS attempts failed too
+    
+    Between attempts we wait a random time up to a limit that doubles each
+    time ("exponential backoff with full jitter"), so a network blip
+    doesn't fail an item and failed workers don't all retry together.
+    
+    Example:
+        data = await _retry_transient(lambda: _get_json(url), "metadata for movie123")
+    """
+    for attempt in range(1, IA_RETRY_ATTEMPTS + 1):
+        try:
+            return await request()
+        except RateLimitedError:
+            raise
+        except TransientError as e:
+            if attempt == IA_RETRY_ATTEMPTS:
+                raise
+            delay = random.uniform(0, min(IA_RETRY_MAX_SEC, IA_RETRY_BASE_SEC * 2 ** (attempt - 1)))
+            logger.warning("[warn] %s: %s - retrying in %.1fs (attempt %d of %d)",
+                           what, e, delay, attempt + 1, IA_RETRY_ATTEMPTS)
+            await asyncio.sleep(delay)
+
+async def head_size(url: str) -> Optional[int]:
+    """
+    Ask IA how big a file is, without downloading it (an HTTP HEAD request).
+    
+    Args:
+        url (str): The file's download URL
+    
+    Returns:
+        Optional[int]: The size in bytes, or None if we couldn't find out
+    
+    Raises:
+        RateLimitedError: If IA answered 429 or 503
+    
+    Only available with aiohttp (check HTTP_AVAILABLE). Download URLs
+    redirect to the server that holds the file, so redirects are followed.
+    Anything else going wrong just means "unknown" - the caller can then
+    download the file as it would have anyway.
+    """
+    async with RATE_GATE.slot() as slot:
+        try:
+            http = await session()
+            async with http.head(url, allow_redirects=True) as r:
+                if r.status in (429, 503):
+                    raise RateLimitedError(retry_after_seconds(r.headers.get("Retry-After")))
+                if r.status != 200:
+                    # A server error isn't a success for the rate gate
+                    slot.failed = r.status in _TRANSIENT_STATUS
+                    return None
+                return int(r.headers["Content-Length"])
+        except RateLimitedError:
+            raise
+        except TRANSPORT_ERRORS:
+            # Network trouble or a timeout
+            slot.failed = True
+            return None
+        except Exception:
+            # Missing/odd Content-Length...
+            return None
 
 # ============================================================================
 # INTERNET ARCHIVE SEARCH
 # ============================================================================
 
-async def ia_search_identifiers(collection: str, media_mode: str, query_extra: Optional[str]) -> List[str]:
+def _search_query(collection: str, media_mode: str, query_extra: Optional[str]) -> str:
     """
-    Search for items in an Internet Archive collection that match our media criteria.
+    Build the IA search query for a collection and media mode.
     
     Args:
         collection (str): The collection ID to search in
@@ -99,14 +571,7 @@ async def ia_search_identifiers(collection: str, media_mode: str, query_extra: O
         query_extra (Optional[str]): Additional search constraints (optional)
     
     Returns:
-        List[str]: List of item identifiers that match our criteria
-    
-    This function uses the IA command-line tool to search for items.
-    It builds a search query and filters the results to only include valid identifiers.
-    
-    Example:
-        ids = await ia_search_identifiers("movies", "video", None)
-        # Returns list of movie item IDs in the "movies" collection
+        str: The query, e.g. 'collection:movies AND mediatype:movies'
     """
     # Build the media type part of the search query
     if media_mode == "video":
@@ -126,26 +591,282 @@ async def ia_search_identifiers(collection: str, media_mode: str, query_extra: O
         # Wrap both parts in parentheses and combine with AND
         q = f"({q}) AND ({query_extra})"
     
+    return q
+
+async def _scrape_items(q: str, fields: str) -> List[Dict]:
+    """
+    Page through IA's scrape API and collect every item it returns.
+    
+    Args:
+        q (str): The search query
+        fields (str): Comma separated fields to return for each item
+    
+    Returns:
+        List[Dict]: One dict per item with (some of) the requested fields
+    
+    Each request returns up to IA_SCRAPE_PAGE_SIZE items plus a "cursor"
+    for the next page; we stop when there's no cursor left. When the file
+    lists are asked for too, pages are IA_SCRAPE_FILES_PAGE_SIZE items
+    instead: 10000 items' worth of file lists is a huge answer that's
+    unlikely to arrive within the request timeout.
+    """
+    items = []
+    count = IA_SCRAPE_FILES_PAGE_SIZE if "files" in fields.split(",") else IA_SCRAPE_PAGE_SIZE
+    params = {"q": q, "fields": fields, "count": str(count)}
+    
+    async def fetch_page():
+        await RATE_GATE.pace()
+        return await _get_json(IA_SCRAPE_URL, params)
+    
+    while True:
+        page = await _retry_transient(fetch_page, "search")
+        items.extend(page.get("items") or [])
+        
+        cursor = page.get("cursor")
+        if not cursor:
+            # Last page
+            break
+        params["cursor"] = cursor
+    return items
+
+def _usable_file_list(files) -> Optional[List[Dict]]:
+    """
+    Check that a scraped "files" value looks like MDAPI's file list.
+    
+    Returns:
+        Optional[List[Dict]]: The list if every entry is a dict with a "name",
+        otherwise None (so the caller asks MDAPI instead)
+    """
+    if not isinstance(files, list) or not files:
+        return None
+    for f in files:
+        if not isinstance(f, dict) or "name" not in f:
+            return None
+    return files
+
+async def ia_scrape_files(collection: str, media_mode: str,
+                          query_extra: Optional[str]) -> List[Tuple[str, Optional[List[Dict]]]]:
+    """
+    Search a collection and get each item's file list in the same requests.
+    
+    Args:
+        collection (str): The collection ID to search in
+        media_mode (str): "video", "audio", or "both" - what type of media to look for
+        query_extra (Optional[str]): Additional search constraints (optional)
+    
+    Returns:
+        List[Tuple[str, Optional[List[Dict]]]]: (identifier, files) for every item.
+        files is None when the search didn't include a usable file list for
+        that item - fetch its metadata with ia_metadata then.
+    
+    This needs aiohttp (it uses the scrape API directly). Asking the search
+    for file lists means thousands of items per request instead of one
+    metadata request per item. If IA refuses the "files" field, we log it
+    and search for identifiers only.
+    
+    Example:
+        for iid, files in await ia_scrape_files("movies", "video", None):
+            if files is None:
+                files = (await ia_metadata(iid)).get("files") or []
+    """
+    global _SEARCH_HAD_FILES
+    
+    q = _search_query(collection, media_mode, query_extra)
+    logger.info("[ia] search: %s", q)
+    
+    _SEARCH_HAD_FILES = False
+    try:
+        items = await _scrape_items(q, "identifier,files")
+        _SEARCH_HAD_FILES = True
+    except RuntimeError as e:
+        # RateLimitedError is a RuntimeError too, but that one should reach the caller
+        # (anything else - even a timeout - may be the file lists being too
+        # much for IA, so the lighter identifier-only search is worth a try)
+        if isinstance(e, RateLimitedError):
+            raise
+        logger.warning("[warn] search with file lists failed (%s), searching identifiers only", e)
+        items = await _scrape_items(q, "identifier")
+    
+    return [(item.get("identifier") or "", _usable_file_list(item.get("files"))) for item in items]
+
+# File lists that came with the search results, waiting for ia_metadata
+# Each entry is used once and then dropped, so a retry asks MDAPI for fresh data
+_SCRAPED_FILES: Dict[str, List[Dict]] = {}
+
+# Whether the collection search asked for (and got) the "files" field
+# If it did, an item without a list in _SCRAPED_FILES simply has none to
+# offer the search API, and prefetch_file_lists has nothing to add
+_SEARCH_HAD_FILES = False
+
+async def ia_search_identifiers(collection: str, media_mode: str, query_extra: Optional[str]) -> List[str]:
+    """
+    Search for items in an Internet Archive collection that match our media criteria.
+    
+    Args:
+        collection (str): The collection ID to search in
+        media_mode (str): "video", "audio", or "both" - what type of media to look for
+        query_extra (Optional[str]): Additional search constraints (optional)
+    
+    Returns:
+        List[str]: List of item identifiers that match our criteria
+    
+    This function uses IA's scrape API (see ia_scrape_files), which returns
+    thousands of identifiers per request and hands back a "cursor" to fetch
+    the next page. Any file lists that come back with the results are kept,
+    so ia_metadata doesn't have to fetch those items again. Without aiohttp
+    (or if the HTTP search fails for a reason other than rate limiting) it
+    uses the IA command-line tool instead. Either way the result only
+    holds valid identifiers, each listed once (see clean_identifiers).
+    
+    Example:
+        ids = await ia_search_identifiers("movies", "video", None)
+        # Returns list of movie item IDs in the "movies" collection
+    """
+    if HTTP_AVAILABLE:
+        try:
+            # HTTP path: one paged search that may also bring the file lists
+            ids = []
+            for iid, files in await ia_scrape_files(collection, media_mode, query_extra):
+                ids.append(iid)
+                if files is not None:
+                    _SCRAPED_FILES[iid] = files
+            
+            # Drops empty or odd identifiers, and an item the paging
+            # happened to return twice
+            return clean_identifiers(ids)
+        except RateLimitedError:
+            # The CLI would hit the same limit - let the caller back off
+            raise
+        except Exception as e:
+            # Network trouble or an unexpected answer - try the IA tool instead
+            if not IA_CLI_AVAILABLE:
+                raise  # No tool to fall back to
+            logger.warning("[warn] HTTP search failed (%s: %s), trying the ia tool", type(e).__name__, e)
+    
+    q = _search_query(collection, media_mode, query_extra)
+    
     # Show the user what we're searching for
-    print(f"[ia] search: {q}")
+    logger.info("[ia] search: %s", q)
     
-    # Run the IA search command
+    # CLI path: run the IA search command
     # --itemlist flag tells IA to return just the identifiers, not full metadata
     code, out, err = await run_cmd([IA_BIN, "search", q, "--itemlist"])
     
     if code != 0:
         # Search failed - raise an error with the error message
-        raise RuntimeError(err.strip() or out.strip())
+        raise RuntimeError(decode_output(err).strip() or decode_output(out).strip())
     
-    # Process the results
-    # Split the output into lines and remove empty lines
-    ids = [ln.strip() for ln in out.splitlines() if ln.strip()]
+    # Strip each line and keep only valid-looking identifiers, each once
+    # (this drops empty lines, and any malformed lines the tool may print
+    # such as warnings)
+    return clean_identifiers(decode_output(out).splitlines())
+
+# ============================================================================
+# METADATA CACHE
+# ============================================================================
+# Fetched metadata is saved as <identifier>.json in META_CACHE_DIR, together
+# with the ETag/Last-Modified headers IA sent with it:
+#     {"etag": ..., "last_modified": ..., "body": {...the metadata...}}
+# An entry younger than the TTL is used as-is. An older one is revalidated:
+# we send its headers back and IA answers a tiny "304 Not Modified" when the
+# item hasn't changed, so we don't download the whole document again.
+# main() can change both settings.
+
+_CACHE_ENABLED = True
+_CACHE_TTL = META_CACHE_TTL_SEC
+
+def configure_metadata_cache(enabled: bool, ttl_sec: int) -> None:
+    """
+    Turn the on-disk metadata cache on or off and set how long entries last.
     
-    # Filter to only include valid-looking identifiers
-    # This removes any malformed results
-    ids = [i for i in ids if looks_like_identifier(i)]
+    Args:
+        enabled (bool): False to always fetch fresh metadata
+        ttl_sec (int): How many seconds a saved entry is used without asking IA
+    """
+    global _CACHE_ENABLED, _CACHE_TTL
+    _CACHE_ENABLED = enabled
+    _CACHE_TTL = ttl_sec
+
+def _cache_path(identifier: str) -> Path:
+    """Where the cached metadata for an identifier lives."""
+    return META_CACHE_DIR / f"{identifier}.json"
+
+@functools.lru_cache(maxsize=256)
+def _cache_parse(path: str, mtime_ns: int) -> Optional[Dict]:
+    """
+    Read and parse one cache file, remembering the result in memory.
+    
+    Args:
+        path (str): The cache file
+        mtime_ns (int): Its modification time - part of the memory key only,
+            so a file that was rewritten is parsed again
     
-    return ids
+    Returns:
+        Optional[Dict]: The cache entry, or None if it's unreadable
+    
+    A retry of the same item within one run gets the parsed entry back
+    without reading or parsing the file again.
+    """
+    try:
+        entry = _json_loads(Path(path).read_bytes())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("body"), dict):
+        return None  # Corrupt, or written by an older version
+    return entry
+
+def _cache_load(identifier: str) -> Tuple[Optional[Dict], bool]:
+    """
+    Look up the cache entry for an identifier.
+    
+    Returns:
+        Tuple[Optional[Dict], bool]: (entry, fresh)
+        - entry is None on a miss (missing, corrupt or old-format file)
+        - fresh is True when the entry is younger than the TTL
+    """
+    path = _cache_path(identifier)
+    try:
+        st = path.stat()
+    except OSError:
+        return None, False
+    entry = _cache_parse(str(path), st.st_mtime_ns)
+    if entry is None:
+        return None, False
+    return entry, time.time() - st.st_mtime <= _CACHE_TTL
+
+def _cache_store(identifier: str, meta: Dict, etag: Optional[str], last_modified: Optional[str]) -> None:
+    """
+    Save metadata (and the headers to revalidate it with) to the cache.
+    
+    The file is written under a temporary name first and then renamed,
+    so a crash (or another run reading at the same time) never sees a
+    half-written entry. Failing to save is not an error - we just won't
+    have a cache hit next time.
+    """
+    entry = {"etag": etag, "last_modified": last_modified, "body": meta}
+    try:
+        META_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=META_CACHE_DIR, prefix=f".{identifier}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, _cache_path(identifier))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as e:
+        logger.warning("[warn] could not cache metadata for %s: %s", identifier, e)
+
+def _cache_touch(identifier: str) -> None:
+    """
+    Mark a cache entry as fresh again after IA said it hasn't changed.
+    
+    Bumping the file's modification time restarts its TTL.
+    """
+    try:
+        os.utime(_cache_path(identifier))
+    except OSError:
+        pass  # Worst case we revalidate it again next time
 
 # ============================================================================
 # METADATA FETCHING
@@ -160,26 +881,165 @@ async def ia_metadata(identifier: str) -> Dict:
     
     Returns:
         Dict: The item's metadata (files, title, description, etc.)
+              With ijson installed the HTTP path only keeps the "files" list,
+              which is the only part the rest of the program uses
     
-    This function uses only the IA command-line tool to get metadata.
-    This avoids SSL certificate issues that can occur with HTTP requests.
+    Raises:
+        RateLimitedError: If IA told us to slow down (HTTP path only)
+        TransientError: If the network or IA kept failing through every retry
+        RuntimeError: If the metadata could not be fetched or parsed
     
-    It includes rate limiting to be polite to IA servers.
+    Items whose file list came with the search results (see ia_scrape_files)
+    are answered from memory as {"files": [...]}, without asking IA.
+    Fresh cached metadata is returned straight from disk without asking IA.
+    Otherwise this asks IA's metadata API (MDAPI) directly over the shared
+    HTTP session (without aiohttp it falls back to the IA command-line tool)
+    and saves the answer to the cache. A stale cache entry is revalidated,
+    so an unchanged item costs a small 304 answer instead of the full document.
+    
+    It includes rate limiting to be polite to IA servers, and at most
+    META_CONCURRENCY requests run at the same time (see META_SEM).
+    """
+    # The search already told us this item's files
+    files = _SCRAPED_FILES.pop(identifier, None)
+    if files is not None:
+        return {"files": files}
+    
+    entry = None
+    if _CACHE_ENABLED:
+        # Reading the cache is disk I/O, so keep it off the event loop
+        entry, fresh = await asyncio.to_thread(_cache_load, identifier)
+        if entry is not None and fresh:
+            return entry["body"]
+    
+    # Network trouble is retried a few times (see _retry_transient)
+    meta, etag, last_modified = await _retry_transient(
+        lambda: _fetch_metadata(identifier, entry), f"metadata for {identifier}")
+    
+    if meta is None:
+        # 304 Not Modified - our stale copy is still correct
+        await asyncio.to_thread(_cache_touch, identifier)
+        return entry["body"]
+    
+    # Only cache real items - IA answers {} for identifiers that don't exist
+    if _CACHE_ENABLED and meta:
+        await asyncio.to_thread(_cache_store, identifier, meta, etag, last_modified)
+    
+    return meta
+
+async def _fetch_metadata(identifier: str,
+                          entry: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[str], Optional[str]]:
     """
-    # Check if we need to wait due to rate limiting
-    await RATE_GATE.wait_if_needed()
+    Fetch metadata for an item from IA (the cache is handled by ia_metadata).
     
-    # Get metadata via the IA command-line tool
-    # This is more reliable than HTTP and avoids SSL certificate issues
-    code, out, err = await run_cmd([IA_BIN, "metadata", identifier])
+    Args:
+        identifier (str): The item's unique identifier
+        entry (Optional[Dict]): A stale cache entry to revalidate, if we have one
+    
+    Returns:
+        Tuple[Optional[Dict], Optional[str], Optional[str]]: (metadata, etag, last_modified)
+        - metadata is None when IA confirmed the cached entry is unchanged
+        - the CLI path never revalidates, and returns no etag/last_modified
+    """
+    async with META_SEM:
+        async with RATE_GATE.slot():
+            if HTTP_AVAILABLE:
+                # HTTP path: one GET on a (usually already open) pooled connection
+                return await _get_json_revalidate(
+                    IA_METADATA_URL.format(identifier=identifier),
+                    entry.get("etag") if entry else None,
+                    entry.get("last_modified") if entry else None,
+                    files_only=True,
+                )
+            
+            if not IA_CLI_AVAILABLE:
+                raise RuntimeError("can't fetch metadata: install aiohttp or the ia tool")
+            
+            # Get metadata via the IA command-line tool
+            code, out, err = await run_cmd([IA_BIN, "metadata", identifier])
     
     if code != 0:
         # CLI failed - raise an error with the error message
-        raise RuntimeError(f"CLI metadata failed: {err.strip() or out.strip()}")
+        raise RuntimeError(f"CLI metadata failed: {decode_output(err).strip() or decode_output(out).strip()}")
     
     try:
-        # Parse the CLI output as JSON
-        return json.loads(out)
-    except json.JSONDecodeError:
+        # Parse the CLI output as JSON (straight from the bytes, no decode needed)
+        return _json_loads(out), None, None
+    except ValueError:
         # CLI returned something that's not valid JSON
         raise RuntimeError("metadata not JSON; update internetarchive or use MDAPI")
+
+async def prefetch_file_lists(identifiers: Iterable[str]) -> None:
+    """
+    Get the file lists of many items with a few search requests.
+    
+    Args:
+        identifiers (Iterable[str]): The items that are about to be resolved
+    
+    This only does anything when the collection search couldn't bring the
+    file lists (it fell back to identifiers only, or to the ia tool). When
+    it did bring them, asking the same search API again would return
+    nothing new while taking request tokens the resolvers need, so we
+    return right away.
+    
+    Otherwise items with fresh cached metadata are left out, and the rest
+    are looked up IA_PREFETCH_CHUNK at a time with one scrape request each
+    (q=identifier:("a" OR "b" ...)). The lists are kept for ia_metadata
+    just like the ones from the collection search - so those items need no
+    MDAPI request of their own.
+    
+    This is only a shortcut: if a request fails, we stop and the remaining
+    items are fetched one by one by ia_metadata as usual. Needs aiohttp.
+    
+    Example:
+        # Runs alongside the resolvers, staying ahead of them
+        task = asyncio.create_task(prefetch_file_lists(ids))
+    """
+    if not HTTP_AVAILABLE or _SEARCH_HAD_FILES:
+        return
+    
+    chunk: List[str] = []
+    for iid in identifiers:
+        if iid in _SCRAPED_FILES:
+            continue  # The collection search already brought its files
+        chunk.append(iid)
+        if len(chunk) >= IA_PREFETCH_CHUNK:
+            if not await _prefetch_chunk(chunk):
+                return
+            chunk = []
+    if chunk:
+        await _prefetch_chunk(chunk)
+
+async def _prefetch_chunk(chunk: List[str]) -> bool:
+    """
+    Fetch the file lists for one chunk of prefetch_file_lists.
+    
+    Returns:
+        bool: False if the request failed and prefetching should stop
+    """
+    if _CACHE_ENABLED:
+        # No need to ask about items whose cached metadata is still fresh
+        fresh = await asyncio.to_thread(lambda: {i for i in chunk if _cache_load(i)[1]})
+        chunk = [i for i in chunk if i not in fresh]
+        if not chunk:
+            return True
+    
+    q = "identifier:(" + " OR ".join(f'"{i}"' for i in chunk) + ")"
+    try:
+        items = await _scrape_items(q, "identifier,files")
+    except RateLimitedError as e:
+        # Everyone has to slow down; the resolvers take it from here
+        await RATE_GATE.backoff(e.seconds)
+        logger.warning("[warn] file list prefetch rate limited, fetching items one by one")
+        return False
+    except Exception as e:
+        logger.warning("[warn] file list prefetch failed (%s: %s), fetching items one by one",
+                       type(e).__name__, e)
+        return False
+    
+    for item in items:
+        iid = item.get("identifier")
+        files = _usable_file_list(item.get("files"))
+        if iid and files is not None:
+            _SCRAPED_FILES[iid] = files
+    return True
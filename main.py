@@ -15,16 +15,55 @@ to work together as a complete application.
 # IMPORTS
 # ============================================================================
 
-import asyncio
-import csv
+import argparse
+import logging
 import sys
 from pathlib import Path
 
 # Import our modules
-from config import DEFAULT_WORKERS, DEFAULT_ARIA_X, DEFAULT_ARIA_S
-from utils import extract_collection_id, require_binary, install_polite_ua
-from ia_client import ia_search_identifiers
-from scheduler import schedule_fixed
+from config import (
+    DEFAULT_WORKERS, DEFAULT_ARIA_X, DEFAULT_ARIA_S, ARIA_X_MAX, ARIA_S_MAX, META_CACHE_TTL_SEC,
+    DNS_PREWARM_HOSTS, IA_BIN,
+)
+from utils import (
+    extract_collection_id, require_binary, has_binary, setup_logging, BatchedCsvLog,
+    prewarm_dns, run_event_loop,
+)
+from ia_client import ia_search_identifiers, configure_metadata_cache, configure_ia_cli
+from http_client import shutdown as shutdown_http, HTTP_AVAILABLE
+from scheduler import schedule_fixed, schedule_batch
+from aria2_rpc import shutdown_daemon
+from manifest import open_manifest, close_manifest
+
+# From the search on, messages go through logging (set up below) - the
+# output from the search and the schedulers arrives that way, so ours must
+# too, or it could be printed ahead of theirs. Only the questions at the
+# start, which come before any of that, use print().
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# COMMAND-LINE OPTIONS
+# ============================================================================
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Read the optional command-line switches.
+    
+    Args:
+        argv: The arguments to parse (None means sys.argv)
+    
+    Returns:
+        argparse.Namespace: The parsed options
+    
+    Everything else is still asked interactively; these switches only
+    control behavior you'd rarely want to change per run.
+    """
+    parser = argparse.ArgumentParser(description="Internet Archive best media grabber")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always fetch fresh item metadata instead of reusing the on-disk cache")
+    parser.add_argument("--cache-ttl", type=int, default=META_CACHE_TTL_SEC, metavar="SECONDS",
+                        help=f"how long cached metadata is reused (default: {META_CACHE_TTL_SEC})")
+    return parser.parse_args(argv)
 
 # ============================================================================
 # USER INPUT HELPERS
@@ -93,19 +132,33 @@ async def main():
     The function handles all the high-level coordination between modules.
     """
     
+    # Step 0: Apply command-line switches
+    args = parse_args()
+    configure_metadata_cache(not args.no_cache, args.cache_ttl)
+    
     # Step 1: Welcome and explanation
     print("Internet Archive best media grabber (static, polite)")
-    print("Uses ia for search, MDAPI for metadata, aria2c for downloads.")
+    print("Uses the IA scrape API for search, MDAPI for metadata (ia as fallback), aria2c for downloads.")
     print()
     
-    # Step 2: Set up polite HTTP requests
-    # This tells servers we're a legitimate tool, not a bot
-    install_polite_ua()
+    # Step 2: Look up archive.org in the background while the user answers
+    # the questions below, so the search doesn't have to wait for DNS
+    # (Our polite User-Agent is set on the shared HTTP session in http_client)
+    # The lookups start right here, before the first (blocking) input() call
+    dns_task = prewarm_dns(DNS_PREWARM_HOSTS)
     
     # Step 3: Check that required tools are installed
-    # The program needs 'ia' and 'aria2c' to be available
-    await require_binary("ia")
-    await require_binary("aria2c")
+    # The program always needs 'aria2c'. 'ia' is optional when aiohttp is
+    # installed (we talk to IA's HTTP APIs directly), otherwise it's required
+    ia_found = has_binary(IA_BIN)
+    configure_ia_cli(ia_found)
+    if ia_found:
+        print(f"[ok] Found {IA_BIN}")
+    else:
+        if not HTTP_AVAILABLE:
+            require_binary(IA_BIN)  # Reports the missing tool and exits
+        print(f"[info] {IA_BIN} not found - using IA's HTTP APIs only")
+    require_binary("aria2c")
     print()
     
     # Step 4: Get collection information
@@ -133,11 +186,16 @@ async def main():
     # Step 6: Get performance settings
     # These control how fast and how many downloads happen at once
     workers = ask_int("Concurrent items (workers)", DEFAULT_WORKERS, 1, 24)
-    aria_x = ask_int("aria2 connections per server (-x)", DEFAULT_ARIA_X, 1, 16)
-    aria_s = ask_int("aria2 splits (-s)", DEFAULT_ARIA_S, 1, 16)
+    aria_x = ask_int("aria2 connections per server (-x)", DEFAULT_ARIA_X, 1, ARIA_X_MAX)
+    aria_s = ask_int("aria2 splits (-s)", DEFAULT_ARIA_S, 1, ARIA_S_MAX)
     
     print(f"[plan] Workers={workers}  aria2: -x {aria_x}  -s {aria_s}  (max-connection-per-server={aria_x})")
     
+    # Batch mode resolves every item first and then downloads the files in
+    # a few big aria2c runs - fastest for collections of many small files
+    batch = input("Download strategy (p=per item, b=batched aria2c runs) [p]: ").strip().lower() == "b"
+    print(f"[plan] Strategy: {'batch' if batch else 'per item'}")
+    
     # Step 7: Set up output directory
     # Downloads go into a downloads folder, organized by collection ID
     downloads_dir = Path.cwd() / "downloads"
@@ -148,18 +206,21 @@ async def main():
     extra = input("Optional extra IA search constraint (ENTER for none): ").strip() or None
     
     # Step 9: Search for items in the collection
-    print("[step] Searching collection...")
+    logger.info("[step] Searching collection...")
+    await dns_task  # Normally finished long ago
     try:
         identifiers = await ia_search_identifiers(collection, media_mode, extra)
     except Exception as e:
-        print(f"[fatal] search failed: {e}")
+        logger.error("[fatal] search failed: %s", e)
+        await shutdown_http()
         sys.exit(3)
     
     if not identifiers:
-        print("[done] No matching items found.")
+        logger.info("[done] No matching items found.")
+        await shutdown_http()
         return
     
-    print(f"[info] Found {len(identifiers)} items")
+    logger.info("[info] Found %d items", len(identifiers))
     
     # Step 10: Set up logging
     # Create output directory and log file
@@ -167,34 +228,54 @@ async def main():
     log_path = out_root / "download_log.csv"
     
     # Open log file for writing
+    # Rows are collected and written in batches by a background task
     log_file = open(log_path, "w", newline="", encoding="utf-8")
-    log_writer = csv.writer(log_file)
+    log_writer = BatchedCsvLog(log_file)
+    log_writer.start()
     
     # Write CSV header
     log_writer.writerow(["identifier", "action", "reason", "item_url", "file_url"])
-    print(f"[log]  {log_path}")
+    logger.info("[log]  %s", log_path)
+    
+    # Load the list of items finished in earlier runs (and keep adding to it)
+    open_manifest(out_root)
     
     # Step 11: Process all items
     try:
-        await schedule_fixed(identifiers, out_root, log_writer, media_mode, workers, aria_x, aria_s)
+        if batch:
+            await schedule_batch(identifiers, out_root, log_writer, media_mode, workers, aria_x, aria_s)
+        else:
+            await schedule_fixed(identifiers, out_root, log_writer, media_mode, workers, aria_x, aria_s)
     finally:
         # Always close the log file, even if there's an error
-        log_file.flush()
+        # (after writing out any rows still waiting in the queue)
+        await log_writer.close()
         log_file.close()
+        # Same for the download manifest
+        await close_manifest()
+        # Stop the background aria2c daemon (if any download started it)
+        await shutdown_daemon()
+        # Close the pooled HTTP connections to archive.org
+        await shutdown_http()
     
     # Step 12: Completion message
-    print("\n[done] All items processed.")
-    print(f"[log]  See {log_path} for skips and failures.")
+    logger.info("\n[done] All items processed.")
+    logger.info("[log]  See %s for skips and failures.", log_path)
 
 # ============================================================================
 # ENTRY POINT
 # ============================================================================
 
 if __name__ == "__main__":
+    # Route log messages through a background output thread
+    listener = setup_logging()
     try:
-        # Run the main function
-        asyncio.run(main())
+        # Run the main function (on uvloop when it's installed)
+        run_event_loop(main())
     except KeyboardInterrupt:
         # Handle Ctrl+C gracefully
-        print("\nInterrupted.")
+        logger.warning("\nInterrupted.")
         sys.exit(1)
+    finally:
+        # Write out any messages still waiting in the queue
+        listener.stop()
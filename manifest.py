@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+DOWNLOAD MANIFEST MODULE
+========================
+
+This module remembers which items were already downloaded in earlier runs.
+It's responsible for:
+1. Loading the list of finished items when a run starts
+2. Answering "did we already get this item?" without asking IA
+3. Adding newly finished items to the list as we go
+
+The list lives in the collection's download folder as ".manifest.csv",
+one row per finished item: identifier, file name, size and media mode.
+New rows are appended in batches (see BatchedCsvLog), and if an item
+shows up more than once the last row wins.
+
+Think of this as a checklist on the fridge: before going shopping for an
+item, we look at the list instead of checking the whole cupboard.
+"""
+
+# ============================================================================
+# IMPORTS
+# ============================================================================
+
+import csv
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from utils import BatchedCsvLog
+
+logger = logging.getLogger(__name__)
+
+# The manifest's file name inside the collection's download folder
+MANIFEST_NAME = ".manifest.csv"
+
+# ============================================================================
+# MANIFEST STATE
+# ============================================================================
+# One manifest per run (one collection), so we keep it in module globals
+
+_DONE: Dict[str, Tuple[str, int, str]] = {}  # identifier -> (name, size, media_mode)
+_FILE = None                                  # The manifest file, open for appending
+_LOG: Optional[BatchedCsvLog] = None          # Batched writer for new rows
+
+# ============================================================================
+# OPEN / CLOSE
+# ============================================================================
+
+def open_manifest(out_root: Path) -> None:
+    """
+    Load the manifest for a collection and get ready to add to it.
+    
+    Args:
+        out_root (Path): The collection's download folder (must exist)
+    
+    Must be called from inside the running event loop (the batched
+    writer starts a background task). Rows that can't be read are
+    ignored, so a damaged manifest only costs us some metadata lookups.
+    """
+    global _FILE, _LOG
+    
+    path = out_root / MANIFEST_NAME
+    _DONE.clear()
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                try:
+                    identifier, name, size, media_mode = row
+                    _DONE[identifier] = (name, int(size), media_mode)
+                except ValueError:
+                    continue  # Wrong number of columns or a bad size
+    except FileNotFoundError:
+        pass  # First run for this collection
+    
+    if _DONE:
+        logger.info("[info] Manifest lists %d items downloaded before", len(_DONE))
+    
+    _FILE = open(path, "a", newline="", encoding="utf-8")
+    _LOG = BatchedCsvLog(_FILE)
+    _LOG.start()
+
+async def close_manifest() -> None:
+    """
+    Write any rows still waiting and close the manifest file.
+    
+    It's safe to call even if open_manifest never ran.
+    """
+    global _FILE, _LOG
+    
+    if _LOG is not None:
+        await _LOG.close()
+        _LOG = None
+    if _FILE is not None:
+        _FILE.close()
+        _FILE = None
+
+# ============================================================================
+# LOOKUP / RECORD
+# ============================================================================
+
+def lookup(identifier: str, media_mode: str) -> Optional[Tuple[str, int]]:
+    """
+    Check whether an item was downloaded before in the same media mode.
+    
+    Args:
+        identifier (str): The item identifier
+        media_mode (str): "video", "audio", or "both"
+    
+    Returns:
+        Optional[Tuple[str, int]]: (file name, size) of the file we got,
+        or None if the item isn't in the manifest for this mode
+    
+    A different media mode may choose a different file, so only entries
+    from the same mode count.
+    """
+    entry = _DONE.get(identifier)
+    if entry is None or entry[2] != media_mode:
+        return None
+    return entry[0], entry[1]
+
+def record(identifier: str, name: str, size: Optional[int], media_mode: str) -> None:
+    """
+    Add a finished item to the manifest.
+    
+    Args:
+        identifier (str): The item identifier
+        name (str): The file we have for it
+        size (Optional[int]): Its size in bytes (entries without a size are
+                              not recorded - we couldn't verify them later)
+        media_mode (str): "video", "audio", or "both"
+    """
+    if size is None or _LOG is None:
+        return
+    
+    entry = (name, size, media_mode)
+    if _DONE.get(identifier) == entry:
+        return  # Already listed
+    
+    _DONE[identifier] = entry
+    _LOG.writerow([identifier, name, size, media_mode])
@@ -9,6 +9,10 @@ with being polite to the servers.
 
 Think of this as the "traffic controller" that ensures we don't overwhelm
 the Internet Archive servers while still processing items efficiently.
+
+There are two schedulers:
+- schedule_fixed: resolvers look items up ahead of time and feed a DownloadPool of download workers
+- schedule_batch: all items are resolved first, then downloaded in one aria2c run
 """
 
 # ============================================================================
@@ -16,11 +20,246 @@ the Internet Archive servers while still processing items efficiently.
 # ============================================================================
 
 import asyncio
+import logging
+import os
 from typing import List
 from pathlib import Path
 
-# Import our worker function
-from worker import process_identifier
+# Import our worker functions
+from worker import process_identifier, resolve_identifier
+from downloader import aria2_download_batch, rate_limited_errtext
+from ia_client import RATE_GATE, RateLimitedError, prefetch_file_lists
+from utils import item_page_url, spare_disk_bytes
+import manifest
+from config import META_CONCURRENCY, RESOLVERS_PER_WORKER, PREFETCH_PER_WORKER, ARIA2_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# ADJUSTABLE CONCURRENCY LIMIT
+# ============================================================================
+
+class DynamicLimiter:
+    """
+    Like asyncio.Semaphore, but the limit can be changed while it's in use.
+    
+    asyncio.Semaphore has no supported way to change its size after it's
+    created, so instead we keep our own counter of running tasks and a
+    Condition that waiting tasks sleep on.
+    
+    Think of it as a bouncer with a clicker, whose manager can phone in a
+    new capacity at any time.
+    
+    Example:
+        lim = DynamicLimiter(8)
+        await lim.acquire()
+        try:
+            ...
+        finally:
+            await lim.release()
+    """
+    
+    def __init__(self, cap: int):
+        """
+        Args:
+            cap (int): How many tasks may hold the limiter at once (at least 1)
+        """
+        self._active = 0      # Tasks currently holding the limiter
+        self._cap = max(1, cap)
+        self._cond = asyncio.Condition()
+    
+    @property
+    def cap(self) -> int:
+        """The current limit."""
+        return self._cap
+    
+    async def acquire(self) -> None:
+        """Wait until we're under the limit, then take a place."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._cap)
+            self._active += 1
+    
+    async def release(self) -> None:
+        """Give a place back and wake up one waiting task."""
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
+    
+    async def set_cap(self, n: int) -> None:
+        """
+        Change the limit.
+        
+        Args:
+            n (int): The new limit (at least 1)
+        
+        Lowering it doesn't interrupt anyone - tasks already running finish
+        normally, and new ones wait until we're back under the new limit.
+        """
+        async with self._cond:
+            self._cap = max(1, n)
+            self._cond.notify_all()  # Raising it may let several waiters in
+
+# ============================================================================
+# WORKER POOL
+# ============================================================================
+
+class DownloadPool:
+    """
+    A fixed fleet of worker coroutines that take items from a queue.
+    
+    Instead of creating one task per item, we start N long-lived workers.
+    Each one repeatedly takes the next item from the queue, processes
+    it with process_identifier, and goes back for more. An item is an
+    identifier plus (optionally) its already resolved job. Memory use stays the
+    same no matter how many items there are, and resize() can change the
+    number of workers while the pool is running.
+    
+    Think of it as a team of N people working through one shared to-do list.
+    """
+    
+    def __init__(self, out_root: Path, log_writer, media_mode: str, aria_x: int, aria_s: int,
+                 queue_size: int = 0):
+        """
+        Set up an empty pool (call resize() to start workers).
+        
+        Args:
+            out_root (Path): Root directory for downloads
+            log_writer: CSV writer for logging results
+            media_mode (str): "video", "audio", or "both"
+            aria_x (int): aria2 connections per server
+            aria_s (int): aria2 splits
+            queue_size (int): How many items may wait in the queue (0 = no limit)
+        """
+        self.out_root = out_root
+        self.log_writer = log_writer
+        self.media_mode = media_mode
+        self.aria_x = aria_x
+        self.aria_s = aria_s
+        
+        self.q: asyncio.Queue = asyncio.Queue(maxsize=queue_size)  # (identifier, job) waiting to be processed
+        self._workers = {}     # worker_id -> running task
+        self._target = 0       # How many workers we want right now
+        self._next_id = 0      # Id for the next worker we start
+        
+        # Progress and statistics
+        self.total = 0             # Items submitted (or expected, see schedule_fixed)
+        self.done_cnt = 0          # Items processed
+        self.disk_space_skips = 0  # Items skipped due to low disk space
+        self.disk_full = False     # Once True, remaining items are not started
+    
+    @property
+    def stopping(self) -> bool:
+        """True once the pool has stopped starting new items."""
+        return self.disk_full
+    
+    def submit(self, identifier: str) -> None:
+        """Add an item to the end of an unlimited queue."""
+        self.q.put_nowait((identifier, None))
+        self.total += 1
+    
+    async def put(self, identifier: str, job: dict) -> None:
+        """
+        Add a resolved item to the queue, waiting while the queue is full.
+        
+        Unlike submit(), this doesn't count towards total - the caller
+        sets total up front.
+        """
+        await self.q.put((identifier, job))
+    
+    def resize(self, n: int) -> None:
+        """
+        Change how many workers are running.
+        
+        Args:
+            n (int): The new number of workers (at least 1)
+        
+        Growing starts new workers straight away. Shrinking lets the extra
+        workers finish the item they're on and then retire.
+        """
+        self._target = max(1, n)
+        while len(self._workers) < self._target:
+            worker_id = self._next_id
+            self._next_id += 1
+            self._workers[worker_id] = asyncio.create_task(self.worker(worker_id))
+    
+    async def worker(self, worker_id: int):
+        """
+        One worker: take items from the queue and process them until cancelled.
+        
+        Args:
+            worker_id (int): This worker's number
+        """
+        while True:
+            # Retire if the pool has been shrunk below our count
+            if len(self._workers) > self._target:
+                del self._workers[worker_id]
+                return
+            
+            iid, job = await self.q.get()
+            try:
+                if self.stopping:
+                    # Stopping - take the item off the queue without starting it
+                    continue
+                
+                result = await process_identifier(iid, self.out_root, self.log_writer, self.media_mode,
+                                                  self.aria_x, self.aria_s, job)
+                self.done_cnt += 1
+                
+                # Track disk space skips
+                if result.get("status") == "skip" and result.get("reason") == "insufficient_disk_space":
+                    self.disk_space_skips += 1
+                    if not self.disk_full:
+                        # First disk space error - stop starting new downloads
+                        self.disk_full = True
+                        logger.warning("[stop] Disk space insufficient - stopping new downloads")
+                        logger.info("[info] Current downloads will continue to completion")
+                
+                # Show progress
+                logger.info("[prog] %d/%d complete", self.done_cnt, self.total)
+            
+            except Exception as e:
+                # process_identifier handles its own errors, so this is a bug -
+                # but one bad item shouldn't stop all the other downloads
+                # Log it like any other failure and carry on
+                self.done_cnt += 1
+                logger.warning("[fail]   %s: unhandled %s: %s", iid, type(e).__name__, str(e)[:300])
+                self.log_writer.writerow([iid, "FAIL", f"unhandled: {type(e).__name__}: {str(e)[:500]}",
+                                          item_page_url(iid), ""])
+            
+            finally:
+                self.q.task_done()
+    
+    async def join(self):
+        """
+        Wait until every queued item has been taken care of, then stop the workers.
+        """
+        await self.q.join()
+        
+        # All workers are now idle, waiting on an empty queue
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
+# ============================================================================
+# FILE LIST PREFETCH
+# ============================================================================
+
+def _start_prefetch(identifiers: List[str], media_mode: str) -> asyncio.Task:
+    """
+    Start fetching file lists in bulk in the background (see prefetch_file_lists).
+    
+    Items the manifest already lists are left out - resolve_identifier
+    skips them without needing their metadata.
+    """
+    todo = [i for i in identifiers if manifest.lookup(i, media_mode) is None]
+    return asyncio.create_task(prefetch_file_lists(todo))
+
+async def _stop_prefetch(task: asyncio.Task) -> None:
+    """Stop the background prefetch once every item has been resolved."""
+    task.cancel()
+    # gather hands back the task's CancelledError instead of raising it
+    await asyncio.gather(task, return_exceptions=True)
 
 # ============================================================================
 # FIXED CONCURRENCY SCHEDULER
@@ -29,7 +268,7 @@ from worker import process_identifier
 async def schedule_fixed(identifiers: List[str], out_root: Path, log_writer, media_mode: str,
                          workers: int, aria_x: int, aria_s: int):
     """
-    Process multiple items with a fixed number of concurrent workers.
+    Process multiple items with a fixed number of concurrent download workers.
     
     Args:
         identifiers (List[str]): List of item identifiers to process
@@ -40,101 +279,295 @@ async def schedule_fixed(identifiers: List[str], out_root: Path, log_writer, med
         aria_x (int): aria2 connections per server
         aria_s (int): aria2 splits
     
+    The work runs as a two-stage pipeline:
+    1. Resolvers (RESOLVERS_PER_WORKER per worker) fetch metadata and choose
+       the file for each item, and put the result in a queue
+    2. A DownloadPool of 'workers' workers takes resolved items from that
+       queue and downloads them
+    3. When everything is done, a summary is shown
+    
+    Metadata lookups are small and quick, downloads are big and slow, so
+    while the workers download, the resolvers are already preparing the
+    next items. The queue only holds PREFETCH_PER_WORKER items per worker,
+    so the resolvers never run far ahead of the downloads. If the search
+    couldn't include file lists, they're fetched in bulk meanwhile
+    (prefetch_file_lists), which saves the resolvers most of their
+    metadata requests.
+    
+    There are never more than 'workers' downloads running at the same time,
+    which helps us be polite to servers.
+    """
+    
+    workers = max(1, workers)
+    pool = DownloadPool(out_root, log_writer, media_mode, aria_x, aria_s,
+                        queue_size=workers * PREFETCH_PER_WORKER)
+    pool.total = total = len(identifiers)
+    
+    # Every resolver takes the next identifier from this shared iterator
+    it = iter(identifiers)
+    
+    async def resolver():
+        """Resolve items and hand them to the pool until none are left."""
+        for iid in it:
+            if pool.stopping:
+                # Disk full - don't look up any more items
+                return
+            try:
+                job = await resolve_identifier(iid, out_root, log_writer, media_mode)
+            except RateLimitedError as e:
+                # Slow everyone down, and let the worker resolve this item
+                # again with its usual retry handling
+                await RATE_GATE.backoff(e.seconds)
+                job = None
+            except Exception:
+                # Leave it to the worker, which logs the failure properly
+                job = None
+            await pool.put(iid, job)
+    
+    # Step 1: Start the download workers, then the resolvers that feed them
+    # Alongside them, file lists are fetched in bulk if the search couldn't bring them
+    pool.resize(workers)
+    # The resolvers' first requests pace themselves from a single token
+    RATE_GATE.reset()
+    prefetch = _start_prefetch(identifiers, media_mode)
+    resolvers = [asyncio.create_task(resolver())
+                 for _ in range(min(total, workers * RESOLVERS_PER_WORKER))]
+    
+    # Step 2: Wait until everything has been resolved, then downloaded
+    await asyncio.gather(*resolvers)
+    await _stop_prefetch(prefetch)
+    await pool.join()
+    
+    # All items processed (or stopped early due to disk space)
+    if pool.disk_full:
+        logger.info("[done] Processing stopped early after %d/%d items", pool.done_cnt, total)
+        logger.info("[summary] %d items skipped due to insufficient disk space", pool.disk_space_skips)
+        logger.warning("[final] Cannot continue - disk is full. Free up space before running again.")
+    else:
+        logger.info("[done] All %d items processed", total)
+        # Show disk space summary if any items were skipped
+        if pool.disk_space_skips > 0:
+            logger.info("[summary] %d items skipped due to insufficient disk space", pool.disk_space_skips)
+
+# ============================================================================
+# BATCH SCHEDULER
+# ============================================================================
+
+async def schedule_batch(identifiers: List[str], out_root: Path, log_writer, media_mode: str,
+                         workers: int, aria_x: int, aria_s: int):
+    """
+    Resolve every item first, then download the chosen files in batched aria2c runs.
+    
+    Args:
+        identifiers (List[str]): List of item identifiers to process
+        out_root (Path): Root directory for downloads
+        log_writer: CSV writer for logging results
+        media_mode (str): "video", "audio", or "both"
+        workers (int): How many files aria2 downloads at once (-j)
+        aria_x (int): aria2 connections per server
+        aria_s (int): aria2 splits
+    
     This function:
-    1. Creates a semaphore to limit concurrent workers
-    2. Starts the initial batch of workers
-    3. As each worker completes, starts a new one
-    4. Continues until all items are processed
-    5. Shows progress updates
-    
-    The semaphore ensures we never have more than 'workers' items
-    being processed at the same time, which helps us be polite to servers.
+    1. Resolves items (metadata, file choice, local check), META_CONCURRENCY at a time
+    2. Collects the files that still need downloading
+    3. Downloads them with one aria2c run per ARIA2_BATCH_SIZE files
+       (aria2 schedules the files within a batch itself), checking before
+       each run that the files fit on the disk
+    4. Retries the rate limited ones once after backing off
+    5. Logs failures and shows a summary
+    
+    This avoids starting aria2 once per file, which matters most for
+    collections with many small items.
+    
+    The per-item disk check in resolve_identifier can't protect us here:
+    nothing downloads while we resolve, so every item sees the same free
+    space. Instead, each batch's known file sizes are added up and
+    compared with the space left before the run starts. Files that don't
+    fit (and everything after them) are skipped as insufficient_disk_space,
+    like in per-item mode.
     """
     
-    # Create a semaphore to limit concurrent workers
-    # A semaphore is like a pool of permits - only 'workers' permits available
-    # Each worker needs a permit to start, and returns it when done
-    sem = asyncio.Semaphore(max(1, workers))
+    # A limiter caps how many items are being resolved at the same time
+    # Nothing downloads while we resolve, so this only has to respect the
+    # metadata limit, not the (smaller) download worker count
+    # A "slow down" answer halves the cap; each resolved item raises it by
+    # one again, back up to the starting value
+    resolvers = max(1, META_CONCURRENCY)
+    lim = DynamicLimiter(resolvers)
     
     # Track progress and statistics
     total = len(identifiers)
     done_cnt = 0
     disk_space_skips = 0  # Track how many items were skipped due to low disk space
-    disk_full = False  # Flag to stop starting new downloads when disk is full
+    disk_full = False  # Flag to stop resolving new items when disk is full
+    jobs = []  # Resolved download jobs waiting for the batch run
     
-    # Define the worker function that uses the semaphore
     async def one(iid: str):
         """
-        Process one item with semaphore control.
+        Resolve one item under the concurrency limiter.
         
         Args:
-            iid (str): The item identifier to process
+            iid (str): The item identifier to resolve
         
         Returns:
-            The result from process_identifier
+            (iid, result) where result comes from resolve_identifier,
+            or None if the disk filled up before this item got its turn
         """
-        # Acquire a permit from the semaphore (blocks if none available)
-        async with sem:
-            # Process the item and return the result
-            return await process_identifier(iid, out_root, log_writer, media_mode, aria_x, aria_s)
+        if disk_full:
+            # Disk is full - don't even queue up for the limiter
+            return iid, None
+        await lim.acquire()
+        try:
+            if disk_full:
+                # The disk filled up while we were waiting for our turn
+                return iid, None
+            try:
+                try:
+                    result = await resolve_identifier(iid, out_root, log_writer, media_mode)
+                except RateLimitedError as e:
+                    # Fewer items at once from now on, then back off and
+                    # retry once, like process_identifier does
+                    await lim.set_cap(lim.cap // 2)
+                    await RATE_GATE.backoff(e.seconds)
+                    logger.warning("[warn] %s: rate limited. backing off %ds then retrying once", iid, e.seconds)
+                    result = await resolve_identifier(iid, out_root, log_writer, media_mode)
+                
+                if lim.cap < resolvers:
+                    await lim.set_cap(lim.cap + 1)
+                return iid, result
+            except Exception as e:
+                # Same handling as process_identifier's catch-all
+                logger.warning("[fail]   %s: exception: %s: %s", iid, type(e).__name__, str(e)[:300])
+                log_writer.writerow([iid, "FAIL", f"exception: {type(e).__name__}: {str(e)[:500]}",
+                                     item_page_url(iid), ""])
+                return iid, {"bytes": 0, "seconds": 0.0, "status": "fail"}
+        finally:
+            await lim.release()
     
-    # Step 1: Start the initial batch of workers
-    # We start up to 'workers' tasks immediately
-    running = set()  # Set to track running tasks
-    it = iter(identifiers)  # Iterator over the identifiers
+    def handle(iid: str, result: dict) -> None:
+        """Count one resolved item and keep its job if it needs downloading."""
+        nonlocal done_cnt, disk_space_skips, disk_full
+        done_cnt += 1
+        
+        if result.get("status") == "ready":
+            jobs.append((iid, result))
+        elif result.get("reason") == "insufficient_disk_space":
+            disk_space_skips += 1
+            if not disk_full:
+                disk_full = True
+                logger.warning("[stop] Disk space insufficient - stopping new items")
+        
+        logger.info("[prog] %d/%d resolved", done_cnt, total)
     
-    # Start the first batch of workers
-    for _ in range(min(workers, total)):
-        try:
-            # Get the next identifier and create a task for it
-            next_id = next(it)
-            task = asyncio.create_task(one(next_id))
-            running.add(task)
-        except StopIteration:
-            # No more identifiers to process
-            break
+    # Every resolver takes the next identifier from this shared iterator
+    it = iter(identifiers)
     
-    # Step 2: Process tasks as they complete
-    while running:
-        # Wait for at least one task to complete
-        # asyncio.wait returns (done_tasks, pending_tasks)
-        done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
-        
-        # Process completed tasks
-        for task in done:
-            # Get the result (this will raise any exceptions that occurred)
-            result = task.result()
-            done_cnt += 1
-            
-            # Track disk space skips
-            if result.get("status") == "skip" and result.get("reason") == "insufficient_disk_space":
-                disk_space_skips += 1
-                if not disk_full:
-                    # First disk space error - stop starting new downloads
-                    disk_full = True
-                    print(f"[stop] Disk space insufficient - stopping new downloads")
-                    print(f"[info] Current downloads will continue to completion")
+    async def resolver():
+        """Resolve items and handle each result right away, until none are left."""
+        for iid in it:
+            if disk_full:
+                return  # Don't look up any more items
+            iid, result = await one(iid)
+            if result is not None:
+                handle(iid, result)
+    
+    # Step 1: Resolve items, up to 'resolvers' of them at a time (the
+    # limiter in one() sees to that). A fixed set of resolver coroutines
+    # works through the list, like schedule_fixed's: no task per item, and
+    # no loop in between waiting for results to hand out the next items
+    # The resolvers' first requests pace themselves from a single token
+    RATE_GATE.reset()
+    prefetch = _start_prefetch(identifiers, media_mode)
+    await asyncio.gather(*[asyncio.create_task(resolver()) for _ in range(min(total, resolvers))])
+    await _stop_prefetch(prefetch)
+    
+    # Step 2: Download everything, ARIA2_BATCH_SIZE files per aria2c run
+    batches = (len(jobs) + ARIA2_BATCH_SIZE - 1) // ARIA2_BATCH_SIZE
+    logger.info("[step] Downloading %d files in %d aria2c run(s) (-j %d)", len(jobs), batches, workers)
+    pending = jobs
+    ok_cnt = 0
+    fail_cnt = 0
+    
+    def fit_on_disk(chunk: list) -> list:
+        """
+        Keep the start of a batch that fits on the disk; skip the rest.
+        
+        Once a file doesn't fit, it and every file after it (in this and
+        later batches) are logged as skipped for disk space. Files of
+        unknown size count as zero - we can't plan for those.
+        """
+        nonlocal disk_space_skips, disk_full
+        fits = chunk
+        if not disk_full:
+            spare = spare_disk_bytes(out_root)
+            if spare is not None:
+                need = 0
+                for n, (_, job) in enumerate(chunk):
+                    need += job["size"] or 0
+                    if need > spare:
+                        fits = chunk[:n]
+                        disk_full = True
+                        logger.warning("[stop] Disk space insufficient - not downloading the remaining files")
+                        break
+        else:
+            fits = []
+        
+        for iid, job in chunk[len(fits):]:
+            disk_space_skips += 1
+            logger.info("[skip] %s: not enough disk space left for %s", iid, job["name"])
+            log_writer.writerow([iid, "SKIP", "insufficient_disk_space", job["page"], ""])
+        return fits
+    
+    for attempt in (1, 2):
+        if not pending:
+            break
+        
+        results = {}
+        started = []  # The jobs that actually went to aria2
+        for i in range(0, len(pending), ARIA2_BATCH_SIZE):
+            chunk = fit_on_disk(pending[i:i + ARIA2_BATCH_SIZE])
+            if not chunk:
+                continue
+            started.extend(chunk)
+            results.update(await aria2_download_batch(
+                [(job["url"], job["dest_dir"], job["name"]) for _, job in chunk],
+                aria_x, aria_s, max(1, workers),
+            ))
+        
+        retry = []
+        back_max = 0
+        for iid, job in started:
+            ok, err = results[job["url"]]
+            if ok:
+                ok_cnt += 1
+                logger.info("[ok]     downloaded -> %s", os.path.join(job['dest_dir'], job['name']))
+                manifest.record(iid, job["name"], job["size"], media_mode)
+                continue
             
-            # Show progress
-            print(f"[prog] {done_cnt}/{total} complete")
+            # Rate limited on the first attempt? Retry it once after backing off
+            back = rate_limited_errtext(err)
+            if back and attempt == 1:
+                retry.append((iid, job))
+                back_max = max(back_max, back)
+                continue
             
-            # Try to start a new task ONLY if disk is not full and there are more identifiers
-            if not disk_full:
-                try:
-                    next_id = next(it)
-                    new_task = asyncio.create_task(one(next_id))
-                    running.add(new_task)
-                except StopIteration:
-                    # No more identifiers to process
-                    pass
-    
-    # All tasks completed (or stopped early due to disk space)
+            fail_cnt += 1
+            logger.warning("[fail]   %s: aria2c: %s", iid, err[:300])
+            log_writer.writerow([iid, "FAIL", f"aria2_error: {err[:500]}", job["page"], job["url"]])
+        
+        if retry:
+            await RATE_GATE.backoff(back_max)
+            logger.warning("[warn] %d files rate limited. backing off %ds then retrying once", len(retry), back_max)
+            # (the retry run's rate gate pacing waits the backoff out)
+        pending = retry
+    
+    # Step 3: Summary
+    # (files skipped for disk space at download time count as skipped)
+    logger.info("[done] %d downloaded, %d failed, %d skipped or failed before download",
+                ok_cnt, fail_cnt, done_cnt - ok_cnt - fail_cnt)
     if disk_full:
-        print(f"[done] Processing stopped early after {done_cnt}/{total} items")
-        print(f"[summary] {disk_space_skips} items skipped due to insufficient disk space")
-        print(f"[final] Cannot continue - disk is full. Free up space before running again.")
-    else:
-        print(f"[done] All {total} items processed")
-        # Show disk space summary if any items were skipped
-        if disk_space_skips > 0:
-            print(f"[summary] {disk_space_skips} items skipped due to insufficient disk space")
+        # Items that got as far as a download attempt, or were settled before one
+        finished = done_cnt - len(jobs) + ok_cnt + fail_cnt
+        logger.info("[done] Processing stopped early after %d/%d items", finished, total)
+    if disk_space_skips > 0:
+        logger.info("[summary] %d items skipped due to insufficient disk space", disk_space_skips)
@@ -16,18 +16,42 @@ Think of these as the basic building blocks that other modules use to do their w
 # These are the Python libraries we need for these utility functions
 
 import os          # For operating system functions (like checking if we're on Windows)
+import logging     # For the program-wide message output
+import logging.handlers
+import queue       # For handing log messages to the output thread
 import re          # For regular expressions (pattern matching in text)
 import asyncio     # For running commands asynchronously (without blocking)
-import urllib.request  # For making HTTP requests with custom headers
+import csv         # For the results log
 import sys         # For exiting the program
 import shutil      # For checking disk space
+import socket      # For looking up host names ahead of time
+import time        # For timing how old a cached disk reading is
+from collections import deque  # For keeping only the last lines of output
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime  # For Retry-After dates
 from pathlib import Path  # For working with file paths
-from typing import List, Tuple, Optional  # For type hints (telling Python what types we expect)
+from typing import Iterable, List, Tuple, Optional  # For type hints (telling Python what types we expect)
+
+from config import LOG_BATCH_ROWS, RETRY_AFTER_MAX_SEC, DISK_CHECK_TTL_SEC
+
+# uvloop is an optional, faster drop-in event loop (POSIX only)
+# pip install uvloop - without it we simply use asyncio's own loop
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
 
 # ============================================================================
 # SYSTEM DETECTION
 # ============================================================================
 
+# The OS can't change while we run, so check it once at import time
+# os.name == "nt" is how Python identifies Windows
+# "nt" stands for "New Technology" (Windows NT)
+_IS_WINDOWS = os.name == "nt"
+
 def is_windows() -> bool:
     """
     Check if we're running on Windows or not.
@@ -36,18 +60,47 @@ def is_windows() -> bool:
         bool: True if running on Windows, False otherwise (Linux, Mac, etc.)
     
     Why we need this:
-    - Different operating systems have different commands
-    - Windows uses "where" to find programs, others use "which"
-    - This helps us use the right command for the current system
+    - uvloop, the faster event loop used by run_event_loop below,
+      only exists on Linux, Mac and other POSIX systems
     """
-    # os.name == "nt" is how Python identifies Windows
-    # "nt" stands for "New Technology" (Windows NT)
-    return os.name == "nt"
+    return _IS_WINDOWS
+
+def run_event_loop(coro):
+    """
+    Run the program's main coroutine until it finishes, like asyncio.run().
+    
+    Args:
+        coro: The coroutine to run (e.g. main())
+    
+    Returns:
+        Whatever the coroutine returns
+    
+    When uvloop is installed (and we're not on Windows, where it doesn't
+    exist) the coroutine runs on uvloop. Its loop is written in C, so the
+    constant task bookkeeping, waiting and subprocess pipes the schedulers
+    do all cost less. Otherwise this is just asyncio.run().
+    """
+    if uvloop is None or _IS_WINDOWS:
+        return asyncio.run(coro)
+    
+    if hasattr(uvloop, "run"):
+        return uvloop.run(coro)
+    
+    # Older uvloop versions have no run() - install it as the loop policy
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(coro)
 
 # ============================================================================
 # URL AND IDENTIFIER PROCESSING
 # ============================================================================
 
+# Compiled once at import time, like _ID_RE below
+# r"/details/([^/?#]+)" is a regular expression that means:
+# - "/details/" - literally match these characters
+# - ([^/?#]+) - capture one or more characters that are NOT /, ?, or #
+# - This captures the collection ID part
+_DETAILS_RE = re.compile(r"/details/([^/?#]+)")
+
 def extract_collection_id(s: str) -> str:
     """
     Extract a collection ID from a full Internet Archive URL or just return the ID if it's already clean.
@@ -68,11 +121,8 @@ def extract_collection_id(s: str) -> str:
     s = s.strip()
     
     # Look for a pattern like "/details/SOMETHING" in the URL
-    # r"/details/([^/?#]+)" is a regular expression that means:
-    # - "/details/" - literally match these characters
-    # - ([^/?#]+) - capture one or more characters that are NOT /, ?, or #
-    # - This captures the collection ID part
-    m = re.search(r"/details/([^/?#]+)", s)
+    # See _DETAILS_RE above for what the pattern means
+    m = _DETAILS_RE.search(s)
     
     if m:
         # If we found a match, return the captured group (the collection ID)
@@ -112,6 +162,14 @@ def file_download_url(identifier: str, filename: str) -> str:
     """
     return f"https://archive.org/download/{identifier}/{filename}"
 
+# Compiled once at import time; looks_like_identifier runs for every search result
+# Pattern:
+# ^ - start of string
+# [A-Za-z0-9] - first character must be letter or number
+# [A-Za-z0-9_\-.]+ - rest can be letters, numbers, underscore, hyphen, or dot
+# \Z - true end of string ($ would also accept a trailing newline)
+_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_\-.]+\Z")
+
 def looks_like_identifier(s: str) -> bool:
     """
     Check if a string looks like a valid Internet Archive identifier.
@@ -125,7 +183,7 @@ def looks_like_identifier(s: str) -> bool:
     Rules for valid identifiers:
     - Must start with a letter or number
     - Can contain letters, numbers, underscores, hyphens, and dots
-    - Must be at least 1 character long
+    - Must be at least 2 characters long
     
     Examples:
         looks_like_identifier("movie123") -> True
@@ -135,38 +193,106 @@ def looks_like_identifier(s: str) -> bool:
         looks_like_identifier("") -> False
         looks_like_identifier("movie 123") -> False (space not allowed)
     """
-    # Regular expression pattern:
-    # ^ - start of string
-    # [A-Za-z0-9] - first character must be letter or number
-    # [A-Za-z0-9_\-\.]+ - rest can be letters, numbers, underscore, hyphen, or dot
-    # $ - end of string
-    return bool(re.match(r"^[A-Za-z0-9][A-Za-z0-9_\-\.]+$", s))
+    # Fast path for the most common case: nothing but ASCII letters and digits
+    # isascii/isalnum are single C-level scans, cheaper than starting the regex
+    # (isalnum alone would also accept letters like "é", hence isascii)
+    if len(s) >= 2 and s.isascii() and s.isalnum():
+        return True
+    
+    # Everything else (dots, dashes, underscores, or invalid) - see _ID_RE above
+    return _ID_RE.match(s) is not None
+
+def clean_identifiers(lines: Iterable[str]) -> List[str]:
+    """
+    Tidy up a list of identifiers: strip, drop invalid ones, drop repeats.
+    
+    Args:
+        lines (Iterable[str]): Raw identifiers (search results, lines of tool output...)
+    
+    Returns:
+        List[str]: The valid identifiers, each once, in their original order
+    
+    An item listed twice would otherwise be looked up and checked twice.
+    A dict keeps its keys in the order they were added, so dict.fromkeys
+    removes repeats in one pass while keeping the first of each.
+    
+    Example:
+        clean_identifiers([" movie1 ", "movie2", "movie1", "", "bad id"]) -> ["movie1", "movie2"]
+    """
+    return list(dict.fromkeys(i for i in (ln.strip() for ln in lines) if looks_like_identifier(i)))
 
 # ============================================================================
 # COMMAND EXECUTION
 # ============================================================================
 
-async def run_cmd(args: List[str]) -> Tuple[int, str, str]:
+async def _drain(stream: asyncio.StreamReader, tail: Optional[int]) -> bytes:
+    """
+    Read everything from a subprocess pipe, optionally keeping only the last lines.
+    
+    Args:
+        stream (asyncio.StreamReader): The pipe to read
+        tail (Optional[int]): Keep only this many trailing lines (None keeps everything)
+    
+    Returns:
+        bytes: The captured output
+    
+    We keep reading until the program closes the pipe, so the program never
+    stalls waiting for us to make room. With a tail limit, older lines are
+    thrown away as new ones arrive, so memory use stays bounded however
+    chatty the program is.
+    """
+    if tail is None:
+        # Keep everything (e.g. JSON output that we need in full)
+        chunks = []
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+    
+    lines = deque(maxlen=tail)  # Only the most recent 'tail' lines survive
+    partial = b""               # Start of a line we haven't seen the end of yet
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        pieces = (partial + chunk).split(b"\n")
+        partial = pieces.pop()[-65536:]  # Cap even a line that never ends
+        lines.extend(pieces)
+    if partial:
+        lines.append(partial)
+    return b"\n".join(lines)
+
+async def run_cmd(args: List[str], tail: Optional[int] = None) -> Tuple[int, bytes, bytes]:
     """
     Run a command-line program and capture its output.
     
     Args:
         args (List[str]): List of command arguments
                          First item is the program name, rest are arguments
+        tail (Optional[int]): If set, keep only the last 'tail' lines of each
+                              output stream (None keeps everything)
     
     Returns:
-        Tuple[int, str, str]: (return_code, stdout, stderr)
+        Tuple[int, bytes, bytes]: (return_code, stdout, stderr)
         - return_code: 0 means success, non-zero means error
-        - stdout: The normal output from the command
-        - stderr: Any error messages from the command
+        - stdout: The normal output from the command (raw bytes)
+        - stderr: Any error messages from the command (raw bytes)
+    
+    The output is returned undecoded, so callers only pay for turning it
+    into text when they actually read it (see decode_output). Often they
+    don't: a JSON parser can read the bytes directly, and error output is
+    only needed when the command failed.
+    
+    Use tail for chatty programs whose full output we don't need (like
+    aria2), so a long run can't fill up memory with progress lines.
     
     Example:
-        result = await run_cmd(["ls", "-la"])
-        code, output, errors = result
+        code, out, err = await run_cmd(["ls", "-la"])
         if code == 0:
-            print("Command succeeded:", output)
+            print("Command succeeded:", decode_output(out))
         else:
-            print("Command failed:", errors)
+            print("Command failed:", decode_output(err))
     """
     # Create a subprocess (run another program)
     # asyncio.create_subprocess_exec runs the command without blocking our program
@@ -176,15 +302,67 @@ async def run_cmd(args: List[str]) -> Tuple[int, str, str]:
         stderr=asyncio.subprocess.PIPE   # Capture any error output
     )
     
-    # Wait for the command to finish and get its output
-    # communicate() waits for the process to complete
-    out_b, err_b = await proc.communicate()
+    # Read both pipes at the same time until the program closes them,
+    # then wait for it to exit
+    out_b, err_b = await asyncio.gather(_drain(proc.stdout, tail), _drain(proc.stderr, tail))
+    await proc.wait()
+    
+    return proc.returncode, out_b, err_b
+
+def decode_output(data: bytes) -> str:
+    """
+    Turn captured program output into text.
+    
+    Args:
+        data (bytes): Output from run_cmd
+    
+    Returns:
+        str: The text, with any invalid UTF-8 replaced instead of raising an error
+    """
+    return data.decode("utf-8", "replace")
+
+def prewarm_dns(hosts) -> asyncio.Future:
+    """
+    Look up host names ahead of time so later connections don't wait for DNS.
+    
+    Args:
+        hosts: Host names to look up (e.g. ("archive.org",))
+    
+    Returns:
+        asyncio.Future: Finishes when every lookup is done (await it, or don't)
+    
+    The answers end up in the system's DNS cache (where it has one), so
+    the first real request - ours or aria2's - finds them ready. Failures
+    are ignored; the real request will simply look the name up itself.
+    
+    This is a plain function on purpose: the lookups are handed to worker
+    threads before it returns, so they run even if the caller goes straight
+    on to something that blocks the event loop (like input()).
+    """
+    loop = asyncio.get_running_loop()
+    # getaddrinfo blocks, so each lookup runs in a thread
+    # (run_in_executor takes no keyword arguments: 0 = any address family)
+    return asyncio.gather(
+        *(loop.run_in_executor(None, socket.getaddrinfo, host, 443, 0, socket.SOCK_STREAM) for host in hosts),
+        return_exceptions=True,
+    )
+
+def has_binary(name: str) -> bool:
+    """
+    Check (quietly) whether a program is installed.
+    
+    Args:
+        name (str): The name of the program to look for
+    
+    Returns:
+        bool: True if the program can be found on the PATH
     
-    # Convert the binary output to text and return everything
-    # decode("utf-8", "replace") converts bytes to text, replacing invalid characters
-    return proc.returncode, out_b.decode("utf-8", "replace"), err_b.decode("utf-8", "replace")
+    Unlike require_binary this never exits - use it for optional tools.
+    shutil.which searches the PATH itself, so no extra process is started.
+    """
+    return shutil.which(name) is not None
 
-async def require_binary(name: str) -> None:
+def require_binary(name: str) -> None:
     """
     Check if a required program is installed on the system.
     If not found, exit the program with an error.
@@ -196,16 +374,13 @@ async def require_binary(name: str) -> None:
         SystemExit: If the program is not found
     
     Example:
-        await require_binary("aria2c")  # Check if aria2c is installed
-    """
-    # Choose the right command based on the operating system
-    # Windows uses "where", other systems use "which"
-    finder = "where" if is_windows() else "which"
-    
-    # Try to find the program
-    code, _, _ = await run_cmd([finder, name])
+        require_binary("aria2c")  # Check if aria2c is installed
     
-    if code != 0:
+    Like has_binary this uses shutil.which, which works the same on every
+    operating system (on Windows it also tries .exe and friends), so we
+    don't need to start "which" or "where" to look.
+    """
+    if not has_binary(name):
         # Program not found - exit with error
         print(f"[FATAL] Required tool not found: {name}")
         print(f"Please install {name} and try again.")
@@ -231,22 +406,78 @@ def _size_int(x) -> Optional[int]:
     This is used for converting file sizes from strings to numbers.
     Sometimes file sizes might be missing or invalid, so we need to handle that safely.
     
+    This is the slow path: pick_best_file parses the common digit-string
+    sizes itself and only calls this for unusual values.
+    
     Example:
         _size_int("123") -> 123
         _size_int(123) -> 123
         _size_int("abc") -> None
         _size_int(None) -> None
     """
+    # Common cases first, without going through an exception
+    if x is None:
+        return None  # No size given
+    if isinstance(x, int):
+        # Already a number (int() turns True/False into plain 1/0)
+        return int(x)
+    if isinstance(x, str):
+        s = x.strip()
+        # isdecimal (not isdigit) - isdigit also accepts things like "²",
+        # which int() can't convert
+        if s.isdecimal() or (s[:1] == "-" and s[1:].isdecimal()):
+            return int(s)
+        # Anything else ("+5", "1_000", "abc", ...) goes to int() below
+    
+    # Everything else (odd strings, floats, bytes, ...) - let int() decide
     try:
         return int(x)
-    except Exception:
-        # If anything goes wrong (not a number, None, etc.), return None
+    except (TypeError, ValueError, OverflowError):
+        # Not a number - return None
         return None
 
+def retry_after_seconds(value: Optional[str], default: int = 90) -> int:
+    """
+    Turn a Retry-After header value into a number of seconds.
+    
+    Args:
+        value (Optional[str]): The header value (None if the header was missing)
+        default (int): What to use when the header is missing or unreadable
+    
+    Returns:
+        int: Seconds to wait, between 1 and RETRY_AFTER_MAX_SEC
+    
+    The HTTP standard allows two forms: a number of seconds ("120") or a
+    date ("Wed, 21 Oct 2015 07:28:00 GMT"). For a date we wait until then.
+    The result is clamped, so a date in the past still waits a moment and
+    a bogus far-future value can't stall us for days.
+    
+    Example:
+        retry_after_seconds("30") -> 30
+        retry_after_seconds(None) -> 90
+    """
+    try:
+        seconds = int(value)
+    except (TypeError, ValueError):
+        try:
+            # Not a number - try the HTTP-date form
+            dt = parsedate_to_datetime(value)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)  # "-0000" dates come back without a zone
+            seconds = int((dt - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError, IndexError):
+            # Missing or unreadable header
+            seconds = default
+    
+    return max(1, min(seconds, RETRY_AFTER_MAX_SEC))
+
 # ============================================================================
 # DISK SPACE MONITORING
 # ============================================================================
 
+# Recent disk readings: str(path) -> (time.monotonic() when read, free percentage)
+_DISK_CACHE = {}
+
 def get_disk_space_percentage(path: Path) -> float:
     """
     Get the percentage of free disk space for a given path.
@@ -265,7 +496,17 @@ def get_disk_space_percentage(path: Path) -> float:
         free_space = get_disk_space_percentage(Path("./downloads"))
         if free_space < 2.0:
             print("Low disk space!")
+    
+    A reading is reused for DISK_CHECK_TTL_SEC seconds, so checking
+    before every item doesn't mean asking the OS every time.
     """
+    # Use a recent enough reading if we have one
+    key = str(path)
+    now = time.monotonic()
+    cached = _DISK_CACHE.get(key)
+    if cached is not None and now - cached[0] < DISK_CHECK_TTL_SEC:
+        return cached[1]
+    
     try:
         # Get disk usage statistics for the path
         # total, used, free = shutil.disk_usage(path)
@@ -275,12 +516,13 @@ def get_disk_space_percentage(path: Path) -> float:
         # free_space_percentage = (free / total) * 100
         free_space_percentage = (usage.free / usage.total) * 100
         
+        _DISK_CACHE[key] = (now, free_space_percentage)
         return free_space_percentage
         
     except Exception as e:
         # If we can't check disk space, assume it's okay
         # This prevents the program from crashing if there are permission issues
-        print(f"[warn] Could not check disk space: {e}")
+        logger.warning("[warn] Could not check disk space: %s", e)
         return 100.0  # Assume plenty of space
 
 def should_skip_download_for_space(path: Path, threshold: float = 2.0) -> bool:
@@ -305,27 +547,176 @@ def should_skip_download_for_space(path: Path, threshold: float = 2.0) -> bool:
     free_space = get_disk_space_percentage(path)
     return free_space < threshold
 
+def spare_disk_bytes(path: Path, threshold: float = 2.0) -> Optional[int]:
+    """
+    How many bytes can still be written before free space drops below the threshold.
+    
+    Args:
+        path (Path): The path where the downloads go
+        threshold (float): Free space percentage to keep (default 2.0%, like
+                           should_skip_download_for_space)
+    
+    Returns:
+        Optional[int]: Bytes we may still write (0 or less means none),
+        or None if the disk couldn't be checked
+    
+    Unlike get_disk_space_percentage this always asks the OS, because it's
+    meant for checking right before a big batch of downloads - a reading
+    from before the last batch would be out of date.
+    
+    Example:
+        spare = spare_disk_bytes(Path("./downloads"))
+        if spare is not None and spare < 10_000_000:
+            print("Less than 10 MB to spare")
+    """
+    try:
+        usage = shutil.disk_usage(path)
+    except OSError:
+        return None  # Can't tell - the caller goes ahead, as elsewhere
+    return usage.free - int(usage.total * threshold / 100)
+
 # ============================================================================
-# HTTP REQUEST CONFIGURATION
+# LOGGING SETUP
 # ============================================================================
 
-def install_polite_ua():
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that leaves ALL formatting to the output thread.
+    
+    The standard QueueHandler formats each message before queueing it,
+    which means the formatting work happens in whoever logged it. Everything
+    here runs in one process, so we can queue the record untouched and let
+    the listener thread do the formatting.
+    """
+    
+    def prepare(self, record):
+        return record
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Send all log messages to stdout through a background thread.
+    
+    Returns:
+        logging.handlers.QueueListener: The running listener
+                                        (call .stop() at exit to flush it)
+    
+    Logging a message just drops it into a queue; a single listener thread
+    formats it and writes it to stdout. Messages look exactly like the
+    print() output the rest of the program uses (no timestamps or levels).
+    
+    That's why the modules log their messages (each through its own
+    logging.getLogger(__name__)) instead of printing them: the event loop
+    only queues a message and never waits for the terminal.
+    
+    Example:
+        listener = setup_logging()
+        try:
+            run_program()
+        finally:
+            listener.stop()
     """
-    Set up a polite User-Agent for HTTP requests to Internet Archive.
+    q = queue.SimpleQueue()
     
-    A User-Agent tells the server what program is making the request.
-    Using a polite User-Agent helps the server know we're a legitimate tool,
-    not a bot or scraper.
+    # The real output: plain messages on stdout
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(logging.Formatter("%(message)s"))
     
-    This function only needs to be called once at the start of the program.
+    # Everyone logs into the queue
+    root = logging.getLogger()
+    root.addHandler(_DeferredQueueHandler(q))
+    root.setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(q, out)
+    listener.start()
+    return listener
+
+# ============================================================================
+# RESULTS LOG (CSV)
+# ============================================================================
+
+class BatchedCsvLog:
     """
-    # Create a new HTTP request opener (the thing that makes web requests)
-    opener = urllib.request.build_opener()
+    A CSV writer that collects rows and writes them in batches.
     
-    # Add a custom header that identifies our program
-    # This tells the server "we're a personal archiving tool"
-    opener.addheaders = [("User-Agent", "IA-personal-archiver (contact: local)")]
+    Workers call writerow() exactly like on a csv.writer, but the row
+    only goes into a queue. One background task takes rows off the queue
+    and writes up to LOG_BATCH_ROWS of them at once with writerows(),
+    followed by a single flush. That means far fewer write calls than
+    one per row, and all writing happens in one place - in a worker
+    thread, so a slow disk never holds up the event loop.
     
-    # Install this opener as the default for all future HTTP requests
-    # Now all urllib.request calls will use our polite User-Agent
-    urllib.request.install_opener(opener)
+    Example:
+        log = BatchedCsvLog(open("log.csv", "w", newline=""))
+        log.start()
+        log.writerow(["movie123", "SKIP", "no_files_in_metadata", "", ""])
+        await log.close()  # Writes anything still queued
+    """
+    
+    # Put on the queue by close(): "no more rows are coming"
+    _STOP = None
+    
+    def __init__(self, f, batch_rows: int = LOG_BATCH_ROWS):
+        """
+        Args:
+            f: An open text file (opened with newline="")
+            batch_rows (int): Most rows written in one go
+        """
+        self._file = f
+        self._writer = csv.writer(f)
+        self._batch_rows = batch_rows
+        self._q: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the background task that writes queued rows (needs a running event loop)."""
+        self._task = asyncio.create_task(self._drain())
+    
+    def writerow(self, row: list) -> None:
+        """Queue one row for writing. Never blocks."""
+        self._q.put_nowait(row)
+    
+    def _write(self, rows: List[list]) -> None:
+        """Write a batch of rows and push them to disk."""
+        self._writer.writerows(rows)
+        self._file.flush()
+    
+    async def _drain(self) -> None:
+        """Write rows as they arrive, grabbing everything queued up at once."""
+        while True:
+            # Wait for at least one row, then take whatever else is ready
+            rows = [await self._q.get()]
+            while len(rows) < self._batch_rows and not self._q.empty():
+                rows.append(self._q.get_nowait())
+            
+            # close() queued the stop marker after the last row, so it can
+            # only be the final entry of a batch
+            stopping = rows[-1] is self._STOP
+            if stopping:
+                rows.pop()
+            if rows:
+                # Only one batch is ever being written, so rows stay in order
+                await asyncio.to_thread(self._write, rows)
+            if stopping:
+                return
+    
+    async def close(self) -> None:
+        """
+        Write every row that's still queued, then stop the background task.
+        
+        The file itself is left open - closing it is up to whoever opened it.
+        """
+        if self._task is not None:
+            # The task writes everything queued before the marker, then ends
+            if not self._task.done():
+                self._q.put_nowait(self._STOP)
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        
+        # Never started, or the task died early - write what's left ourselves
+        rows = []
+        while not self._q.empty():
+            row = self._q.get_nowait()
+            if row is not self._STOP:
+                rows.append(row)
+        if rows:
+            self._write(rows)
@@ -21,26 +21,171 @@ needed to download the best file from that item.
 # ============================================================================
 
 import asyncio
-import random
+import logging
+import os
 import time
-import csv
-import urllib.error
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 # Import our modules
-from config import START_JITTER_SEC
 from utils import item_page_url, file_download_url, should_skip_download_for_space
-from ia_client import ia_metadata, RATE_GATE
-from file_selector import pick_best_file, local_already_ok
+from ia_client import ia_metadata, head_size, RATE_GATE, RateLimitedError
+from http_client import HTTP_AVAILABLE
+from file_selector import pick_best_file, local_already_ok_async, local_size_async
 from downloader import aria2_download, rate_limited_errtext
+import manifest
+from config import PICK_THREAD_MIN_FILES
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# ITEM RESOLUTION (EVERYTHING BEFORE THE DOWNLOAD)
+# ============================================================================
+
+async def resolve_identifier(identifier: str, out_root: Path, log_writer, media_mode: str) -> Dict:
+    """
+    Work out what (if anything) needs downloading for one Internet Archive item.
+    
+    Args:
+        identifier (str): The IA item identifier to process
+        out_root (Path): Root directory for downloads
+        log_writer: CSV writer for logging results
+        media_mode (str): "video", "audio", or "both"
+    
+    Returns:
+        Dict: Either a finished result (same shape as process_identifier's
+        return value, status "skip") or a download job:
+        {
+            "status": "ready",
+            "name": str,       # Filename (e.g., "movie.mp4")
+            "ext": str,        # Extension (e.g., ".mp4")
+            "size": int|None,  # Expected size in bytes (None if unknown)
+            "url": str,        # Direct download URL
+            "dest_dir": str,   # Directory the file goes into
+            "page": str        # Item page URL (for logging)
+        }
+    
+    This covers steps 1-4 of the item workflow: fetch metadata, choose the
+    best file, check disk space and check if we already have the file.
+    Items listed in the download manifest are checked on disk first, so
+    finished items from earlier runs don't cost a metadata request.
+    Skips are logged here; exceptions are left for the caller to handle.
+    """
+    
+    # Create the item's page URL for logging purposes
+    page = item_page_url(identifier)
+    
+    # Record the start time for performance metrics
+    t0 = time.perf_counter()
+    
+    # Directory for this item
+    # A plain string join once per item is cheaper than building Path objects
+    dest_dir = os.path.join(out_root, identifier)
+    
+    # Step 0: Did an earlier run already finish this item?
+    # If the file is still there with the right size, we don't need IA at all
+    done = manifest.lookup(identifier, media_mode)
+    if done is not None:
+        name, sz = done
+        if await local_already_ok_async(dest_dir, name, sz):
+            logger.info("[skip] %s: listed in manifest and size matches -> %s (%s bytes)", identifier, name, sz)
+            return {
+                "bytes": 0, 
+                "seconds": time.perf_counter() - t0, 
+                "status": "skip"
+            }
+    
+    # Step 1: Fetch metadata about this item
+    # This tells us what files are available in the item
+    meta = await ia_metadata(identifier)
+    
+    # Get the list of files from the metadata
+    files = meta.get("files") or []
+    
+    # Check if the item has any files
+    if not files:
+        logger.info("[skip] %s: no files in metadata", identifier)
+        # Log the skip and return metrics
+        log_writer.writerow([identifier, "SKIP", "no_files_in_metadata", page, ""])
+        return {
+            "bytes": 0, 
+            "seconds": time.perf_counter() - t0, 
+            "status": "skip"
+        }
+    
+    # Step 2: Choose the best file to download
+    # (a very long file list is scanned in a thread - see PICK_THREAD_MIN_FILES)
+    if len(files) >= PICK_THREAD_MIN_FILES:
+        best, reason = await asyncio.to_thread(pick_best_file, files, media_mode)
+    else:
+        best, reason = pick_best_file(files, media_mode)
+    
+    if not best:
+        # No suitable file found
+        logger.info("[skip] %s: %s", identifier, reason)
+        log_writer.writerow([identifier, "SKIP", reason or "selection_failed", page, ""])
+        return {
+            "bytes": 0, 
+            "seconds": time.perf_counter() - t0, 
+            "status": "skip"
+        }
+    
+    # Extract file information
+    name = best["name"]      # Filename (e.g., "movie.mp4")
+    sz = best["size"]        # File size in bytes
+    
+    # Step 3a: Check disk space before proceeding
+    # This prevents downloads from filling up the disk completely
+    if should_skip_download_for_space(out_root):
+        logger.info("[skip] %s: insufficient disk space (less than 2%% free) - skipping download", identifier)
+        log_writer.writerow([identifier, "SKIP", "insufficient_disk_space", page, ""])
+        return {
+            "bytes": 0, 
+            "seconds": time.perf_counter() - t0, 
+            "status": "skip",
+            "reason": "insufficient_disk_space"
+        }
+    
+    # Step 3b: Check if we already have this file locally
+    url = file_download_url(identifier, name)
+    
+    if sz is None and HTTP_AVAILABLE:
+        # The metadata doesn't say how big the file is
+        # If we have a copy, one cheap HEAD request tells us whether it's
+        # complete - much cheaper than handing it to aria2 to find out
+        have = await local_size_async(dest_dir, name)
+        if have is not None:
+            sz = await head_size(url)
+        already = have is not None and have == sz
+    else:
+        already = await local_already_ok_async(dest_dir, name, sz)
+    
+    if already:
+        logger.info("[skip] %s: already present and size matches -> %s (%s bytes)", identifier, name, sz)
+        manifest.record(identifier, name, sz, media_mode)
+        return {
+            "bytes": 0, 
+            "seconds": time.perf_counter() - t0, 
+            "status": "skip"
+        }
+    
+    # Something needs downloading - hand back the job
+    return {
+        "status": "ready",
+        "name": name,
+        "ext": best["ext"],
+        "size": sz,
+        "url": url,
+        "dest_dir": dest_dir,
+        "page": page,
+    }
 
 # ============================================================================
 # MAIN WORKER FUNCTION
 # ============================================================================
 
 async def process_identifier(identifier: str, out_root: Path, log_writer, media_mode: str,
-                            aria_x: int, aria_s: int) -> Dict:
+                            aria_x: int, aria_s: int, job: Optional[Dict] = None) -> Dict:
     """
     Process a single Internet Archive item from start to finish.
     
@@ -51,6 +196,8 @@ async def process_identifier(identifier: str, out_root: Path, log_writer, media_
         media_mode (str): "video", "audio", or "both"
         aria_x (int): aria2 connections per server
         aria_s (int): aria2 splits
+        job (Optional[Dict]): An already resolved item (resolve_identifier's
+                              result), so we can skip straight to the download
     
     Returns:
         Dict: Metrics about the processing:
@@ -61,110 +208,57 @@ async def process_identifier(identifier: str, out_root: Path, log_writer, media_
         }
     
     This function implements the complete workflow for one item:
-    1. Add small random delay (jitter) to be polite
-    2. Fetch item metadata from IA
-    3. Choose the best file to download
-    4. Check if we already have it locally
-    5. Download if needed
-    6. Handle errors and retries
-    7. Log the results
+    1. Resolve the item (metadata, file choice, local check) via resolve_identifier,
+       unless the caller already did that and passed in the job
+    2. Download if needed
+    3. Handle errors and retries
+    4. Log the results
     
     The function includes retry logic for rate limiting and comprehensive error handling.
+    Politeness towards IA (request pacing, backoff) is handled by RATE_GATE,
+    so there's no fixed delay before each item.
     """
     
     # Create the item's page URL for logging purposes
     page = item_page_url(identifier)
     
     # Print a header for this item
-    print(f"\n[item] {identifier}")
+    logger.info("\n[item] %s", identifier)
     
     # Record the start time for performance metrics
     t0 = time.perf_counter()
     
-    # Step 1: Add small random delay (jitter)
-    # This prevents all workers from starting downloads at exactly the same time
-    # which could overwhelm the servers
-    await asyncio.sleep(random.uniform(*START_JITTER_SEC))
-    
-    # Step 2: Try to process the item (with retry logic)
+    # Try to process the item (with retry logic)
     # We allow one retry if we get rate limited
     for attempt in (1, 2):
         try:
-            # Step 2a: Check if we need to wait due to rate limiting
-            await RATE_GATE.wait_if_needed()
-            
-            # Step 2b: Fetch metadata about this item
-            # This tells us what files are available in the item
-            meta = await ia_metadata(identifier)
-            
-            # Step 2c: Get the list of files from the metadata
-            files = meta.get("files") or []
-            
-            # Step 2d: Check if the item has any files
-            if not files:
-                print(f"[skip] no files in metadata")
-                # Log the skip and return metrics
-                log_writer.writerow([identifier, "SKIP", "no_files_in_metadata", page, ""])
-                return {
-                    "bytes": 0, 
-                    "seconds": time.perf_counter() - t0, 
-                    "status": "skip"
-                }
+            # Step 1: Work out what to download (or why we're skipping)
+            if job is None:
+                job = await resolve_identifier(identifier, out_root, log_writer, media_mode)
             
-            # Step 2e: Choose the best file to download
-            best, reason = pick_best_file(files, media_mode)
+            if job["status"] != "ready":
+                # Skipped - resolve_identifier already logged why
+                return job
             
-            if not best:
-                # No suitable file found
-                print(f"[skip] {reason}")
-                log_writer.writerow([identifier, "SKIP", reason or "selection_failed", page, ""])
-                return {
-                    "bytes": 0, 
-                    "seconds": time.perf_counter() - t0, 
-                    "status": "skip"
-                }
-            
-            # Step 2f: Extract file information
-            name = best["name"]      # Filename (e.g., "movie.mp4")
-            ext = best["ext"]        # Extension (e.g., ".mp4")
-            sz = best["size"]        # File size in bytes
-            url = file_download_url(identifier, name)  # Direct download URL
-            
-            # Step 2g: Check disk space before proceeding
-            # This prevents downloads from filling up the disk completely
-            if should_skip_download_for_space(out_root):
-                print(f"[skip] insufficient disk space (less than 2% free) - skipping download")
-                log_writer.writerow([identifier, "SKIP", "insufficient_disk_space", page, ""])
-                return {
-                    "bytes": 0, 
-                    "seconds": time.perf_counter() - t0, 
-                    "status": "skip",
-                    "reason": "insufficient_disk_space"
-                }
+            name = job["name"]
+            sz = job["size"]
+            url = job["url"]
+            dest_dir = job["dest_dir"]
             
-            # Step 2h: Check if we already have this file locally
-            dest_dir = out_root / identifier  # Directory for this item
-            if local_already_ok(dest_dir, name, sz):
-                print(f"[skip] already present and size matches -> {name} ({sz} bytes)")
-                return {
-                    "bytes": 0, 
-                    "seconds": time.perf_counter() - t0, 
-                    "status": "skip"
-                }
-            
-            # Step 2i: Display what we're going to download
+            # Step 2: Display what we're going to download
             size_s = "unknown" if sz is None else f"{sz} bytes"
-            print(f"[choose] {name}  ext={ext}  size={size_s}")
-            print(f"[url]    {url}")
+            logger.info("[choose] %s  ext=%s  size=%s", name, job['ext'], size_s)
+            logger.info("[url]    %s", url)
             
-            # Step 2j: Download the file
+            # Step 3: Download the file
             d0 = time.perf_counter()  # Start timing the download
             ok, err = await aria2_download(url, dest_dir, aria_x, aria_s)
             dsec = time.perf_counter() - d0  # Calculate download time
             
             if ok:
                 # Download succeeded
-                print(f"[ok]     downloaded -> {dest_dir / name}")
+                logger.info("[ok]     downloaded -> %s", os.path.join(dest_dir, name))
+                manifest.record(identifier, name, sz, media_mode)
                 return {
                     "bytes": int(sz or 0), 
                     "seconds": dsec, 
@@ -178,24 +272,36 @@ async def process_identifier(identifier: str, out_root: Path, log_writer, media_
                     # Rate limited and this is our first attempt
                     # Set the rate limit and retry once
                     await RATE_GATE.backoff(back)
-                    print(f"[warn] rate limited. backing off {back}s then retrying once")
+                    logger.warning("[warn] rate limited. backing off %ds then retrying once", back)
+                    job = None  # Resolve the item again on the retry
                     continue  # Go to next attempt
                 
                 # Not rate limited, or this was our second attempt
                 # Log the failure and return
-                print(f"[fail]   aria2c: {err[:300]}")  # Show first 300 chars of error
+                logger.warning("[fail]   aria2c: %s", err[:300])  # Show first 300 chars of error
                 log_writer.writerow([identifier, "FAIL", f"aria2_error: {err[:500]}", page, url])
                 return {
                     "bytes": 0, 
                     "seconds": dsec, 
                     "status": "fail"
                 }
-        
-
+            
+        except RateLimitedError as e:
+            # IA told us to slow down while we were fetching metadata
+            if attempt == 1:
+                # First attempt - back off and retry once, like for downloads
+                await RATE_GATE.backoff(e.seconds)
+                logger.warning("[warn] rate limited. backing off %ds then retrying once", e.seconds)
+                continue
+            
+            # Still rate limited on the second attempt - give up on this item
+            logger.warning("[fail]   %s", e)
+            log_writer.writerow([identifier, "FAIL", f"rate_limited: {e}", page, ""])
+            return {"bytes": 0, "seconds": time.perf_counter() - t0, "status": "fail"}
             
         except Exception as e:
             # Any other error
-            print(f"[fail]   exception: {type(e).__name__}: {str(e)[:300]}")
+            logger.warning("[fail]   exception: %s: %s", type(e).__name__, str(e)[:300])
             log_writer.writerow([identifier, "FAIL", f"exception: {type(e).__name__}: {str(e)[:500]}", page, ""])
             return {"bytes": 0, "seconds": time.perf_counter() - t0, "status": "fail"}
     